@@ -0,0 +1,156 @@
+import threading
+import numpy as np
+import sounddevice as sd
+
+##################################
+#########   Continuous microphone capture
+##################################
+
+# Seconds of audio kept in the ring buffer. Consumers that fall further behind
+# than this lose the oldest samples (counted in `overruns`).
+RING_SECONDS = 60
+BLOCK_SIZE = 1024  # Frames per InputStream callback
+
+
+class AudioRingBuffer:
+    """Preallocated mono ring buffer addressed by absolute sample position."""
+
+    def __init__(self, seconds=RING_SECONDS, fs=16000, dtype='int16'):
+        self.fs = fs
+        self.dtype = np.dtype(dtype)
+        self.capacity = int(seconds * fs)
+        self.buffer = np.zeros(self.capacity, dtype=self.dtype)
+        self.written = 0  # Total samples ever written (monotonic)
+        self.overruns = 0
+        self._cond = threading.Condition()
+
+    def oldest(self):
+        # Absolute position of the oldest sample still held in the buffer
+        return max(0, self.written - self.capacity)
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=self.dtype).reshape(-1)
+        total = len(samples)
+        if total > self.capacity:
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        with self._cond:
+            start = (self.written + total - n) % self.capacity
+            end = start + n
+            if end <= self.capacity:
+                self.buffer[start:end] = samples
+            else:
+                split = self.capacity - start
+                self.buffer[start:] = samples[:split]
+                self.buffer[:n - split] = samples[split:]
+            self.written += total
+            self._cond.notify_all()
+
+    def read(self, start, length, out=None, timeout=None):
+        """Copy samples [start, start + length) into `out`, waiting until they exist.
+
+        Returns the filled buffer, or None on timeout. If `start` has already been
+        overwritten, the read is moved forward to the oldest available sample.
+        """
+        if length > self.capacity:
+            raise ValueError("Requested window is larger than the ring buffer")
+        if out is None:
+            out = np.empty(length, dtype=self.dtype)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.written >= start + length, timeout):
+                return None
+            if start < self.oldest():
+                self.overruns += 1
+                start = self.written - length
+            offset = start % self.capacity
+            end = offset + length
+            if end <= self.capacity:
+                out[:length] = self.buffer[offset:end]
+            else:
+                split = self.capacity - offset
+                out[:split] = self.buffer[offset:]
+                out[split:length] = self.buffer[:length - split]
+        return out
+
+    def latest(self, length, out=None):
+        # Most recent `length` samples without waiting
+        with self._cond:
+            start = max(self.oldest(), self.written - length)
+        length = min(length, self.written - start)
+        return self.read(start, length, out=out, timeout=0)
+
+    def windows(self, window, hop=None, start=None):
+        """Yield consecutive windows of `window` samples, `hop` samples apart.
+
+        hop < window gives overlapping windows, hop == window gives gapless
+        back-to-back chunks. The same array is reused for every window, so copy
+        it if it has to outlive the next iteration.
+        """
+        hop = hop or window
+        position = self.written if start is None else start
+        out = np.empty(window, dtype=self.dtype)
+        while True:
+            if position < self.oldest():
+                self.overruns += 1
+                position = self.written - window
+            self.read(position, window, out=out)
+            yield out
+            position += hop
+
+
+class MicrophoneStream:
+    """Callback-driven sounddevice.InputStream feeding an AudioRingBuffer."""
+
+    def __init__(self, fs=16000, dtype='int16', seconds=RING_SECONDS, blocksize=BLOCK_SIZE, device=None):
+        self.ring = AudioRingBuffer(seconds=seconds, fs=fs, dtype=dtype)
+        self.status_errors = 0
+        self._stream = sd.InputStream(
+            samplerate=fs,
+            channels=1,
+            dtype=dtype,
+            blocksize=blocksize,
+            device=device,
+            callback=self._callback,
+        )
+
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            self.status_errors += 1
+        self.ring.write(indata[:, 0])
+
+    def start(self):
+        if not self._stream.active:
+            self._stream.start()
+        return self
+
+    def stop(self):
+        self._stream.stop()
+        self._stream.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, duration):
+        # Block until the next `duration` seconds have been captured and return a copy
+        start = self.ring.written
+        return self.ring.read(start, int(duration * self.ring.fs))
+
+    def windows(self, duration, hop=None):
+        hop_samples = int(hop * self.ring.fs) if hop else None
+        return self.ring.windows(int(duration * self.ring.fs), hop_samples)
+
+
+_microphones = {}
+_microphones_lock = threading.Lock()
+
+
+# Function to get a running microphone stream shared by every caller with the same settings
+def get_microphone(fs=16000, dtype='int16'):
+    with _microphones_lock:
+        key = (fs, np.dtype(dtype).name)
+        if key not in _microphones:
+            _microphones[key] = MicrophoneStream(fs=fs, dtype=dtype).start()
+        return _microphones[key]
@@ -1,16 +1,22 @@
 from openai import OpenAI
+from ratelimit import RateLimitedClient
 import os
-import requests
-import sounddevice as sd
+from imagefetch import save_image, RESPONSE_FORMAT
+from imagesequence import ImageSequence
+from history import HistoryStore
+from promptbuilder import PromptBuilder
+from gencache import GenerationCache
 import speech_recognition as sr
-from scipy.io.wavfile import write
 from dotenv import load_dotenv
-from collections import deque
+from audiocapture import get_microphone
+from transcription import GoogleEngine
+from metrics import metrics, METRICS_JSONL
 
 # Load environment variables
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Rate limited with retries and a circuit breaker; the SDK's own retries are off
+client = RateLimitedClient(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0))
 
 ##################################
 #########   Load Inputs
@@ -25,25 +31,28 @@ IMAGE_FOLDER = "Generated_Images"
 if not os.path.exists(IMAGE_FOLDER):
     os.makedirs(IMAGE_FOLDER)
 
+# Persistent counter for image_N.jpeg filenames
+image_sequence = ImageSequence(IMAGE_FOLDER)
+
+# Previously generated images keyed by prompt, for replays and repeated inputs
+generation_cache = GenerationCache()
+
 def get_next_image_filename():
-    """Find the next available filename in the IMAGE_FOLDER with an incrementing number."""
-    existing_files = os.listdir(IMAGE_FOLDER)
-    # Extract numbers from filenames like "image_1.jpeg", "image_2.jpeg", etc.
-    image_numbers = [
-        int(f.split("_")[1].split(".")[0]) for f in existing_files if f.startswith("image_") and f.endswith(".jpeg")
-    ]
-    
-    # Determine the next available number
-    next_number = max(image_numbers) + 1 if image_numbers else 1
-    return f"image_{next_number}.jpeg"
+    """Allocate the next incrementing filename in the IMAGE_FOLDER from its sequence counter."""
+    return image_sequence.next_filename()
 
 
 # File to store input history
 HISTORY_FILE = "history.txt"
 MAX_HISTORY_LINES = 6
+history_store = HistoryStore(HISTORY_FILE, MAX_HISTORY_LINES)
+
+# Keeps role + batch + newest history under the image model's prompt limit
+prompt_builder = PromptBuilder()
 
 # Initialize speech recognizer
 recognizer = sr.Recognizer()
+speech_engine = GoogleEngine(recognizer)
 
 # Base prompt to add context for DALL-E image generation
 base_prompt = (
@@ -56,24 +65,20 @@ base_prompt = (
 #########   Functions
 ##################################
 
-# Function to capture audio using sounddevice and save to WAV
-def capture_audio_input(person_number, filename="user_input.wav", duration=5, fs=44100):
+# Function to capture audio using sounddevice and transcribe it in memory
+def capture_audio_input(person_number, duration=5, fs=44100):
     print(f"Person {person_number}, please say something:")
-    audio_data = sd.rec(int(duration * fs), samplerate=fs, channels=1)
-    sd.wait()  # Wait until recording is finished
-    write(filename, fs, (audio_data * 32767).astype('int16'))  # Save as WAV
-
-    # Transcribe the saved audio file
-    with sr.AudioFile(filename) as source:
-        audio = recognizer.record(source)  # Read the entire audio file
+    with metrics.span("capture"):
+        audio_data = get_microphone(fs).record(duration)  # Next `duration` seconds from the running stream
 
     try:
-        transcription = recognizer.recognize_google(audio)
+        with metrics.span("transcription"):
+            transcription = speech_engine.transcribe(audio_data, fs)
+        if not transcription:
+            print("Could not understand the audio.")
+            return ""
         print(f"Person {person_number}'s input: {transcription}")
         return transcription
-    except sr.UnknownValueError:
-        print("Could not understand the audio.")
-        return ""
     except sr.RequestError as e:
         print(f"Could not request results from Google Speech Recognition service; {e}")
         return ""
@@ -81,21 +86,8 @@ def capture_audio_input(person_number, filename="user_input.wav", duration=5, fs
 
 # Function to update and retrieve history
 def update_and_get_history(new_inputs):
-    # Read existing history from file
-    history = deque(maxlen=MAX_HISTORY_LINES)
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as file:
-            for line in file:
-                history.append(line.strip())
-
-    # Add new inputs to history and write to file
-    history.extend(new_inputs)
-    with open(HISTORY_FILE, "a") as file:
-        for input in new_inputs:
-            file.write(f"{input}\n")
-
-    # Return the last 10 inputs as a list for prompt generation
-    return list(history)
+    # Recent window comes from memory; new inputs are journaled to HISTORY_FILE in batches
+    return history_store.add(new_inputs)
 
 
 # Function to generate an image based on the combined prompt
@@ -103,37 +95,27 @@ def generate_image(system_role, user_inputs ):
     # Combine user inputs into a single descriptive prompt
     history_inputs = update_and_get_history(user_inputs)
     print(history_inputs)
-    combined_history = ". ".join(history_inputs)
-    combined_inputs = ". ".join(user_inputs)
-    final_prompt = (
-        f"{system_role}\n\n"
-        f"Here is the collaborative context from multiple users: {combined_inputs}. "
-        f"Additionally, here is the recent history of inputs: {combined_history}. "
-    )
+    final_prompt = prompt_builder.build(system_role, user_inputs, history_inputs)
+
+    # Serve identical prompts from the cache instead of paying for a new image;
+    # a number is taken only once there is an image to save
+    cache_key = generation_cache.key(final_prompt, "dall-e-3", "1024x1024")
+    img_filepath = generation_cache.restore(cache_key, lambda: os.path.join(IMAGE_FOLDER, get_next_image_filename()))
+    if img_filepath:
+        return img_filepath
 
     try:
         # Send the prompt to OpenAI's DALL-E API for image generation
-        response = client.images.generate(model="dall-e-3", prompt=final_prompt,
-        n=1,
-        size="1024x1024")
-
-        # Extract the image URL from the response
-        image_url = response.data[0].url
-        print(f"Image URL: {image_url}")
-
-        # Download and save the image locally with an incrementing filename
-        img_data = requests.get(image_url).content
-        img_filename = get_next_image_filename()
-        img_filepath = os.path.join(IMAGE_FOLDER, img_filename)
-
-        # Download and save the image locally
-        img_data = requests.get(image_url).content
-        img_filename = "Generated_Image.jpeg"
-
-        with open(img_filepath, 'wb') as handler:
-            handler.write(img_data)
-
-        print(f"Image saved as {img_filepath}")
+        with metrics.span("api_call"):
+            response = client.images.generate(model="dall-e-3", prompt=final_prompt,
+            n=1,
+            size="1024x1024",
+            response_format=RESPONSE_FORMAT)
+
+        # Save the image locally with an incrementing filename
+        img_filepath = os.path.join(IMAGE_FOLDER, get_next_image_filename())
+        save_image(response.data[0], img_filepath)
+        generation_cache.put(cache_key, img_filepath)
         return img_filepath
 
     except Exception as e:
@@ -147,6 +129,10 @@ def generate_image(system_role, user_inputs ):
 
 
 if __name__ == "__main__":
+    # Stage timings go to a rotating JSONL file when METRICS_JSONL is set
+    if METRICS_JSONL:
+        metrics.export_jsonl(METRICS_JSONL)
+
     # Define the system role for the image generation
     system_role = (
         "You are an AI model specializing in collaborative art generation. "
@@ -1,16 +1,20 @@
 from openai import OpenAI
+from ratelimit import RateLimitedClient
 import os
-import requests
+from imagefetch import save_image, RESPONSE_FORMAT
+from imagesequence import ImageSequence
+from history import HistoryStore
+from gencache import GenerationCache
 import sounddevice as sd
 import speech_recognition as sr
 from scipy.io.wavfile import write
 from dotenv import load_dotenv
-from collections import deque
 
 # Load environment variables
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Rate limited with retries and a circuit breaker; the SDK's own retries are off
+client = RateLimitedClient(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0))
 
 ##################################
 #########   Load Inputs
@@ -25,22 +29,22 @@ IMAGE_FOLDER = "Generated_Images"
 if not os.path.exists(IMAGE_FOLDER):
     os.makedirs(IMAGE_FOLDER)
 
+# Persistent counter for image_N.jpeg filenames
+image_sequence = ImageSequence(IMAGE_FOLDER)
+
+# Previously generated images keyed by prompt, for replays and repeated inputs
+generation_cache = GenerationCache()
+
 def get_next_image_filename():
-    """Find the next available filename in the IMAGE_FOLDER with an incrementing number."""
-    existing_files = os.listdir(IMAGE_FOLDER)
-    # Extract numbers from filenames like "image_1.jpeg", "image_2.jpeg", etc.
-    image_numbers = [
-        int(f.split("_")[1].split(".")[0]) for f in existing_files if f.startswith("image_") and f.endswith(".jpeg")
-    ]
-    
-    # Determine the next available number
-    next_number = max(image_numbers) + 1 if image_numbers else 1
-    return f"image_{next_number}.jpeg"
+    """Allocate the next incrementing filename in the IMAGE_FOLDER from its sequence counter."""
+    return image_sequence.next_filename()
 
 
 # File to store input history
 HISTORY_FILE = "history.txt"
 MAX_HISTORY_LINES = 3
+history_store = HistoryStore(HISTORY_FILE, MAX_HISTORY_LINES)
+
 
 # Initialize speech recognizer
 recognizer = sr.Recognizer()
@@ -81,59 +85,36 @@ def capture_audio_input(person_number, filename="user_input.wav", duration=5, fs
 
 # Function to update and retrieve history
 def update_and_get_history(new_inputs):
-    # Read existing history from file
-    history = deque(maxlen=MAX_HISTORY_LINES)
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as file:
-            for line in file:
-                history.append(line.strip())
-
-    # Add new inputs to history and write to file
-    history.extend(new_inputs)
-    with open(HISTORY_FILE, "a") as file:
-        for input in new_inputs:
-            file.write(f"{input}\n")
-
-    # Return the last 10 inputs as a list for prompt generation
-    return list(history)
+    # Recent window comes from memory; new inputs are journaled to HISTORY_FILE in batches
+    return history_store.add(new_inputs)
 
 
 # Function to generate an image based on the combined prompt
 def generate_image(system_role, user_inputs ):
-    # Combine user inputs into a single descriptive prompt
+    # Variations take no prompt, so the inputs only go to the history
     history_inputs = update_and_get_history(user_inputs)
     print(history_inputs)
-    combined_history = ". ".join(history_inputs)
-    combined_inputs = ". ".join(user_inputs)
-    final_prompt = (
-        f"{system_role}\n\n"
-        f"Here is the collaborative context from multiple users: {combined_inputs}. "
-        f"Additionally, here is the recent history of inputs: {combined_history}. "
-    )
 
-    try:
-        # Send the prompt to OpenAI's DALL-E API for image generation
-        response = client.images.create_variation(model="dall-e-2",image=open("Generated_Images/image_9.jpeg"), prompt=final_prompt,
-        n=1,
-        size="1024x1024")
-
-        # Extract the image URL from the response
-        image_url = response.data[0].url
-        print(f"Image URL: {image_url}")
-
-        # Download and save the image locally with an incrementing filename
-        img_data = requests.get(image_url).content
-        img_filename = get_next_image_filename()
-        img_filepath = os.path.join(IMAGE_FOLDER, img_filename)
-
-        # Download and save the image locally
-        img_data = requests.get(image_url).content
-        img_filename = "Generated_Image.jpeg"
-
-        with open(img_filepath, 'wb') as handler:
-            handler.write(img_data)
+    # Serve a repeated batch on the same source image from the cache;
+    # a number is taken only once there is an image to save
+    source_image = "Generated_Images/image_9.jpeg"
+    cache_key = generation_cache.key(". ".join(user_inputs), "dall-e-2", "1024x1024", "variation", source_image)
+    img_filepath = generation_cache.restore(cache_key, lambda: os.path.join(IMAGE_FOLDER, get_next_image_filename()))
+    if img_filepath:
+        return img_filepath
 
-        print(f"Image saved as {img_filepath}")
+    try:
+        # Ask OpenAI's DALL-E API for a variation of the source image
+        with open(source_image, "rb") as image_file:
+            response = client.images.create_variation(model="dall-e-2", image=image_file,
+            n=1,
+            size="1024x1024",
+            response_format=RESPONSE_FORMAT)
+
+        # Save the image locally with an incrementing filename
+        img_filepath = os.path.join(IMAGE_FOLDER, get_next_image_filename())
+        save_image(response.data[0], img_filepath)
+        generation_cache.put(cache_key, img_filepath)
         return img_filepath
 
     except Exception as e:
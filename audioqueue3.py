@@ -1,24 +1,43 @@
 from openai import OpenAI
+from ratelimit import RateLimitedClient
 import os
-from PIL import Image
 from dotenv import load_dotenv
-import requests  # Import requests to handle HTTP requests for image download
+from imagefetch import save_image, image_bytes, write_atomic, RESPONSE_FORMAT
+from imagesequence import ImageSequence
+from history import HistoryStore
+from promptbuilder import PromptBuilder, DALLE2_PROMPT_TOKENS, DALLE2_PROMPT_CHARS
+from gencache import GenerationCache
+import io
+from PIL import Image
+from imageprep import prepare_image, prepare_mask, to_rgba
+from masks import plan_edit, apply_edit
 import sounddevice as sd
 import speech_recognition as sr
 from scipy.io.wavfile import write
-from collections import deque
 
 # Load environment variables
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Rate limited with retries and a circuit breaker; the SDK's own retries are off
+client = RateLimitedClient(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0))
 # Base configuration
 IMAGE_SIZE = "1024x1024"
+EDIT_SIZE = "512x512"  # Edits only repaint a masked crop of this size, composited back into the canvas
 IMAGE_FOLDER = "Generated_Images"
 BATCH_SIZE = 3  # Trigger image generation every 3 inputs
 # File to store input history
 HISTORY_FILE = "history.txt"
 MAX_HISTORY_LINES = 7
+history_store = HistoryStore(HISTORY_FILE, MAX_HISTORY_LINES)
+
+# Keeps role + batch + newest history under DALL-E 2's 1000-character prompt limit
+prompt_builder = PromptBuilder(max_tokens=DALLE2_PROMPT_TOKENS, max_chars=DALLE2_PROMPT_CHARS)
+
+# Persistent counter for image_N.jpeg filenames
+image_sequence = ImageSequence(IMAGE_FOLDER)
+
+# Previously generated images keyed by prompt, for replays and repeated inputs
+generation_cache = GenerationCache()
 
 
 # Initialize speech recognizer
@@ -61,81 +80,74 @@ def capture_audio_input(person_number, filename="user_input.wav", duration=5, fs
 
 # Function to update and retrieve history
 def update_and_get_history(new_inputs):
-    # Read existing history from file
-    history = deque(maxlen=MAX_HISTORY_LINES)
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as file:
-            for line in file:
-                history.append(line.strip())
-
-    # Add new inputs to history and write to file
-    history.extend(new_inputs)
-    with open(HISTORY_FILE, "a") as file:
-        for input in new_inputs:
-            file.write(f"{input}\n")
-
-    # Return the last 10 inputs as a list for prompt generation
-    return list(history)
+    # Recent window comes from memory; new inputs are journaled to HISTORY_FILE in batches
+    return history_store.add(new_inputs)
 
 def generate_image_with_history(system_prompt, history, latest_image_path):
     # Create a combined prompt based on the system prompt, user history, and the latest inputs
     # Combine user inputs into a single descriptive prompt
     history_inputs = update_and_get_history(user_inputs)
     print(history_inputs)
-    combined_history = ". ".join(history_inputs)
-    combined_inputs = ". ".join(user_inputs)
-    combined_prompt = (
-        f"{system_role}\n\n"
-        f"Modify the image by adding the following new element(s): {combined_inputs}. "
-        f"Current context based on previous inputs: {combined_history}. "
-        f" Make sure the new element blends seamlessly with the existing elements."
+    combined_prompt = prompt_builder.build(
+        system_role, user_inputs, history_inputs,
+        inputs_label="Modify the image by adding the following new element(s):",
+        history_label="Current context based on previous inputs:",
+        closing="Make sure the new element blends seamlessly with the existing elements.",
     )
+    # Serve identical prompt + base image combinations from the cache;
+    # a number is taken only once there is an image to save
+    mode = "edit" if latest_image_path else "generate"
+    cache_key = generation_cache.key(combined_prompt, None, IMAGE_SIZE, mode, latest_image_path)
+    img_filename = generation_cache.restore(cache_key, get_next_image_filename)
+    if img_filename:
+        return img_filename
+
     # If there is an existing image, we use it for inpainting
     if latest_image_path:
-        # Ensure the image is in RGBA format
+        # Mask the flattest tiles of the canvas, one per input, inside a single crop
         with Image.open(latest_image_path) as img:
-            img = img.convert("RGBA")
-            rgba_image_path = "temp_rgba_image.png"
-            img.save(rgba_image_path, format="PNG")  # Save as PNG with RGBA
-
-        with open(rgba_image_path, "rb") as img_file:
-            # Call the OpenAI API with inpainting options
-            response = client.images.edit(
-                image=img_file,
-                prompt=combined_prompt,
-                n=1,
-                size=IMAGE_SIZE
-            )
-    else:
-        # No previous image, start fresh
-        response = client.images.create(
+            canvas = to_rgba(img, IMAGE_SIZE)
+        plan = plan_edit(canvas, len(user_inputs))
+
+        # Call the OpenAI API with inpainting options on the crop only
+        response = client.images.edit(
+            image=prepare_image(plan.crop, EDIT_SIZE),
+            mask=prepare_mask(plan.mask, EDIT_SIZE),
             prompt=combined_prompt,
             n=1,
-            size=IMAGE_SIZE
+            size=EDIT_SIZE,
+            response_format=RESPONSE_FORMAT
         )
+
+        # Blend the repainted region back into the full canvas and save that
+        with Image.open(io.BytesIO(image_bytes(response.data[0]))) as edited:
+            canvas = apply_edit(canvas, plan, edited)
+        output = io.BytesIO()
+        canvas.convert("RGB").save(output, format="JPEG", quality=95)
+        img_filename = get_next_image_filename()
+        write_atomic(img_filename, [output.getvalue()])
+        generation_cache.put(cache_key, img_filename)
+        print(f"Image saved as {img_filename}")
+        return img_filename
+
+    # No previous image, start fresh
+    response = client.images.generate(
+        prompt=combined_prompt,
+        n=1,
+        size=IMAGE_SIZE,
+        response_format=RESPONSE_FORMAT
+    )
     
-    # Extract the image URL from the response and save it
-    image_url = response.data[0].url
+    # Save the returned image under the next filename
     img_filename = get_next_image_filename()
-    download_image(image_url, img_filename)
+    save_image(response.data[0], img_filename)
+    generation_cache.put(cache_key, img_filename)
     
     return img_filename
 
 def get_next_image_filename():
     # Generate next image filename, e.g., image_1.jpeg, image_2.jpeg, etc.
-    existing_files = os.listdir(IMAGE_FOLDER)
-    image_numbers = [
-        int(f.split("_")[1].split(".")[0]) for f in existing_files if f.startswith("image_") and f.endswith(".jpeg")
-    ]
-    next_number = max(image_numbers) + 1 if image_numbers else 1
-    return f"{IMAGE_FOLDER}/image_{next_number}.jpeg"
-
-def download_image(image_url, filename):
-    # Download and save the image from the URL
-    img_data = requests.get(image_url).content
-    with open(filename, 'wb') as handler:
-        handler.write(img_data)
-    print(f"Image saved as {filename}")
+    return os.path.join(IMAGE_FOLDER, image_sequence.next_filename())
 
 if __name__ == "__main__":
     # Define the system role for the image generation
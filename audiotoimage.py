@@ -1,13 +1,20 @@
 import speech_recognition as sr
 from openai import OpenAI
-import requests
+from ratelimit import RateLimitedClient
+from imagefetch import save_image, RESPONSE_FORMAT
+from imagestore import ImageStore
+from imagesequence import ImageSequence
 import os
-import time
 
 # Initialize speech recognizer and OpenAI API
 recognizer = sr.Recognizer()
 openai_api_key = ""  # Replace with your OpenAI API Key
-openAI_client = OpenAI(api_key=openai_api_key)
+openAI_client = RateLimitedClient(OpenAI(api_key=openai_api_key, max_retries=0))
+# Every saved image is indexed with the prompt and parent it came from
+image_store = ImageStore()
+# The store is shared with permanentlisten.py (whose canvas images create_variation rejects),
+# so this script only ever continues from its own IMG images
+IMG_MODES = ("initial", "variation", "imported")
 ''''''
 # Record audio and convert to text (simulated for testing purposes)
 with sr.Microphone() as source:
@@ -34,11 +41,14 @@ def create_img_folder():
         print(f'Folder {folder_path} already exists.')
     return folder_path
 
-# Generate a filename to save
-def generate_filename(prefix="Generated_Image"):
-    current_time = time.strftime("%H-%M-%d")  
-    filename = f"{prefix}_{current_time}.jpeg"
-    return filename
+# One counter per name prefix: Generated_Image_1.jpeg, Generated_Image_2.jpeg, ...
+image_sequences = {}
+
+# Save an API image under the next free name; never overwrites, even with concurrent writers
+def save_new_image(image, folder_path, prefix="Generated_Image"):
+    if prefix not in image_sequences:
+        image_sequences[prefix] = ImageSequence(folder_path, prefix=f"{prefix}_")
+    return image_sequences[prefix].save_new(lambda path: save_image(image, path, overwrite=False))
 
 # Generate an image using OpenAI
 def generate_image(prompt):
@@ -49,53 +59,36 @@ def generate_image(prompt):
         size="1024x1024",
         quality="standard",
         n=1,
+        response_format=RESPONSE_FORMAT,
     )
-    image_url = response.data[0].url
-    print(f"Image URL: {image_url}")
-    img_data = requests.get(image_url).content
 
     folder_path = create_img_folder()
-    img_filename = generate_filename()
-    img_file_path = os.path.join(folder_path, img_filename)
 
     # Save image
-    with open(img_file_path, 'wb') as handler:
-        handler.write(img_data)
-
-    print(f"Image saved to {img_file_path}")
+    img_file_path = save_new_image(response.data[0], folder_path)
+    image_store.add_file(img_file_path, prompt=prompt, inputs=[audio_transcription], mode="initial", model="dall-e-3")
     return img_file_path
 
-def get_last_image_path(folder_path):
-    images = [file for file in os.listdir(folder_path) if file.endswith(('.png', '.jpg', '.jpeg'))]
-    if not images:
-        return None
-    
-    images.sort(key=lambda x: os.path.getmtime(os.path.join(folder_path, x)), reverse=True)
-    return os.path.join(folder_path, images[0])
+# Newest IMG image, from the store's index instead of sorting the folder by mtime
+def get_last_image(folder_path):
+    if image_store.latest(IMG_MODES) is None:
+        image_store.import_folder(folder_path)  # First run against an existing folder
+    return image_store.latest(IMG_MODES)
 
-def generate_image_variation(image_path):
+def generate_image_variation(image_path, parent=None):
     print(f"Generating variation of the image: {image_path}")
     
     with open(image_path, 'rb') as image_file:
         response = openAI_client.images.create_variation(
             image=image_file,
             n=1,
-            size="1024x1024"
+            size="1024x1024",
+            response_format=RESPONSE_FORMAT
         )
 
-    image_url = response.data[0].url
-    print(f"Variation Image URL: {image_url}")
-
-    img_data = requests.get(image_url).content
-
     folder_path = create_img_folder()
-    img_filename = generate_filename("Variation_Image")
-    img_file_path = os.path.join(folder_path, img_filename)
-
-    with open(img_file_path, 'wb') as handler:
-        handler.write(img_data)
-    
-    print(f"Variation image saved to {img_file_path}")
+    img_file_path = save_new_image(response.data[0], folder_path, "Variation_Image")
+    image_store.add_file(img_file_path, inputs=[audio_transcription], parent=parent, mode="variation")
     return img_file_path
 
 # Main process logic
@@ -103,12 +96,12 @@ if __name__ == "__main__":
     folder_path = create_img_folder()
 
     # Check if there are any images in the folder
-    last_image_path = get_last_image_path(folder_path)
+    last_image = get_last_image(folder_path)
 
-    if last_image_path:
+    if last_image:
         # Generate a new image based on the last image in the IMG folder
-        print(f"Last image found: {last_image_path}")
-        img_path = generate_image_variation(last_image_path)
+        print(f"Last image found: {last_image.path}")
+        img_path = generate_image_variation(last_image.path, last_image.digest)
     else:
         # If no images, create a new image from the prompt
         print("No existing images found. Generating a new image...")
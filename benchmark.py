@@ -0,0 +1,210 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+from openai import OpenAI
+from scipy.io import wavfile
+from audiocapture import AudioRingBuffer, BLOCK_SIZE
+from fakeopenai import FakeOpenAIServer
+from gencache import GenerationCache
+from history import HistoryStore
+from imagestore import ImageStore
+from inputfilter import InputFilter
+from metrics import metrics
+from pipeline import ImagePipeline
+from ratelimit import RateLimitedClient
+from scheduler import GenerationScheduler, SpeculativeBatcher
+from transcription import create_engine, resample, to_int16
+from vad import StreamingSegmenter
+
+##################################
+#########   End-to-end throughput benchmark
+##################################
+
+# Replays WAV files through capture -> VAD -> STT -> input filter -> batch -> the production
+# ImagePipeline (history, prompt, cache, API, save, store) against the local fake OpenAI server, e.g.
+#   python benchmark.py user_input.wav --repeat 20 --image-latency 1.5 --max-in-flight 2
+
+FS = 16000
+BATCH_SIZE = 3
+MAX_HISTORY_LINES = 10
+GAP_SECONDS = 1.0  # Silence inserted between replayed files so the VAD closes each utterance
+SYSTEM_ROLE = (
+    "You are an AI model specializing in collaborative art generation. "
+    "Your role is to combine multiple user inputs in a hand-drawn sketch illustration on a black background."
+)
+
+stage_times = defaultdict(list)
+stage_lock = threading.Lock()
+
+
+class SpanCollector:
+    """Stands in for the JSONL exporter so the pipeline's own metrics spans land in `stage_times`."""
+
+    def record(self, event):
+        with stage_lock:
+            stage_times[event["stage"]].append(event["seconds"])
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with stage_lock:
+            stage_times[name].append(elapsed)
+
+
+# Function to return the p-th percentile of a list of seconds
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+# Function to load a WAV file as 16 kHz mono int16
+def load_wav(path):
+    fs, audio = wavfile.read(path)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1).astype(audio.dtype)
+    if audio.dtype == np.int32:
+        audio = (audio >> 16).astype(np.int16)
+    elif audio.dtype != np.int16:
+        audio = to_int16(audio)
+    return resample(audio, fs, FS)
+
+
+def run_benchmark(wav_paths, repeat=10, stt="openai", use_silero=False, batch_size=BATCH_SIZE,
+                  max_in_flight=1, max_backlog=2, policy="coalesce", realtime=False, rate_limited=False,
+                  speculative=False, use_filter=True, **server_options):
+    server = FakeOpenAIServer(port=0, **server_options).start()
+    client = OpenAI(base_url=server.base_url, api_key="fake", max_retries=0)
+    if rate_limited:
+        client = RateLimitedClient(client)
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    generation_cache = GenerationCache(os.path.join(workdir, "cache"))
+    pipeline = ImagePipeline(client, workdir, HistoryStore(os.path.join(workdir, "history.txt"), MAX_HISTORY_LINES),
+                             generation_cache, ImageStore(os.path.join(workdir, "store")))
+    input_filter = InputFilter() if use_filter else None
+    metrics.exporter = SpanCollector()
+    engine = create_engine(stt, client=client) if stt == "openai" else create_engine(stt)
+    vad_model = None
+    if use_silero:
+        from models import model_manager
+        vad_model = model_manager.vad()[0]
+    segmenter = StreamingSegmenter(vad_model, fs=FS)
+    ring = AudioRingBuffer(fs=FS)
+    latencies = []
+    images = []
+
+    def generate(system_role, items, claim=None):
+        path = pipeline.generate(system_role, [text for text, _ in items], claim)
+        if path:
+            finished = time.perf_counter()
+            latencies.extend(finished - emitted for _, emitted in items)
+            images.append(path)
+        return path
+
+    if speculative:
+        scheduler = SpeculativeBatcher(generate, SYSTEM_ROLE, batch_size)
+    else:
+        scheduler = GenerationScheduler(generate, SYSTEM_ROLE, max_in_flight, max_backlog, policy)
+    gap = np.zeros(int(GAP_SECONDS * FS), dtype=np.int16)
+    clips = [np.concatenate((load_wav(path), gap)) for path in wav_paths]
+    frame = np.empty(segmenter.frame_samples, dtype=np.int16)
+    position = 0
+    batch = []
+    utterances = 0
+    started = time.perf_counter()
+
+    def handle(utterance):
+        nonlocal batch, utterances
+        emitted = time.perf_counter()
+        utterances += 1
+        with stage("stt"):
+            transcript = engine.transcribe_detailed(utterance, FS)
+        text = input_filter.accept(transcript) if input_filter else transcript.text.strip()
+        if text and speculative:
+            scheduler.add((text, emitted))
+        elif text:
+            batch.append((text, emitted))
+        if len(batch) >= batch_size:
+            scheduler.submit(batch)
+            batch = []
+
+    for clip in clips * repeat:
+        for offset in range(0, len(clip), BLOCK_SIZE):
+            block = clip[offset:offset + BLOCK_SIZE]
+            with stage("capture"):
+                ring.write(block)
+            if realtime:
+                time.sleep(len(block) / FS)
+            while ring.written - position >= len(frame):
+                ring.read(position, len(frame), out=frame)
+                position += len(frame)
+                with stage("segment"):
+                    utterance = segmenter.process(frame)
+                if utterance is not None:
+                    handle(utterance)
+    utterance = segmenter.flush()
+    if utterance is not None:
+        handle(utterance)
+    if batch:
+        scheduler.submit(batch)
+    scheduler.close(wait=True)
+    pipeline.history_store.flush()
+    metrics.exporter = None
+    elapsed = time.perf_counter() - started
+    server.stop()
+
+    stats = scheduler.stats()
+    print(f"\nReplayed {len(clips) * repeat} clips in {elapsed:.2f}s ({workdir})")
+    print(f"Utterances: {utterances}  images: {len(images)}  failed: {stats['failed']}  "
+          f"coalesced: {stats['coalesced']}  dropped: {stats['dropped']}")
+    if input_filter:
+        print(f"Input filter: {input_filter.stats()}")
+    print(f"Generation cache: {generation_cache.stats()}")
+    print(f"Throughput: {utterances / elapsed:.2f} utterances/s, {len(images) / elapsed:.2f} images/s")
+    print(f"End-to-end latency: p50 {percentile(latencies, 50):.3f}s  p95 {percentile(latencies, 95):.3f}s  "
+          f"p99 {percentile(latencies, 99):.3f}s")
+    print(f"{'stage':<16}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}")
+    for name in ("capture", "segment", "vad", "stt", "history_update", "prompt_build", "api_call", "download",
+                 "save"):
+        values = stage_times.get(name, [])
+        mean = sum(values) / len(values) if values else 0.0
+        print(f"{name:<16}{len(values):>8}{sum(values):>10.3f}{mean * 1000:>10.3f}{percentile(values, 95) * 1000:>10.3f}")
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay WAV files through the full listen -> image pipeline")
+    parser.add_argument("wavs", nargs="*", default=["user_input.wav"])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--stt", default="openai", help="openai (fake server), local or google")
+    parser.add_argument("--silero", action="store_true", help="Use Silero VAD instead of the energy gate alone")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=1)
+    parser.add_argument("--max-backlog", type=int, default=2)
+    parser.add_argument("--policy", default="coalesce")
+    parser.add_argument("--realtime", action="store_true", help="Feed audio at its real rate")
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    parser.add_argument("--audio-latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-errors", action="store_true", help="Inject 429s instead of 500s")
+    parser.add_argument("--rate-limited", action="store_true", help="Go through RateLimitedClient")
+    parser.add_argument("--speculative", action="store_true", help="Generate on partial batches (SpeculativeBatcher)")
+    parser.add_argument("--no-filter", action="store_true",
+                        help="Skip InputFilter, so repeated clips are not dropped as duplicates")
+    args = parser.parse_args()
+
+    run_benchmark(args.wavs, args.repeat, args.stt, args.silero, args.batch_size, args.max_in_flight,
+                  args.max_backlog, args.policy, args.realtime, args.rate_limited, args.speculative, not args.no_filter,
+                  image_latency=args.image_latency, audio_latency=args.audio_latency,
+                  error_rate=args.error_rate, rate_limit_errors=args.rate_limit_errors)
@@ -0,0 +1,141 @@
+import io
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from imagefetch import image_bytes, write_atomic
+from imageprep import prepare_image, prepare_mask
+
+##################################
+#########   Tiled 16:9 master canvas
+##################################
+
+CANVAS_SIZE = (3840, 2160)  # Projector master, 16:9
+TILE_SIZE = 1024  # One images.edit call per tile
+TILE_OVERLAP = 128  # Pixels shared by neighbouring tiles, blended to hide seams
+TILES_PER_BATCH = 2
+MAX_TILE_WORKERS = 4
+
+
+# Function to spread `count` tile origins evenly over `length` pixels
+def _origins(length, tile, overlap):
+    count = max(1, math.ceil((length - overlap) / (tile - overlap)))
+    if count == 1:
+        return [0]
+    step = (length - tile) / (count - 1)
+    return [int(round(i * step)) for i in range(count)]
+
+
+# Function to list, per origin, the pixels it shares with the tile before and after it
+def _overlaps(origins, tile):
+    return [(max(0, origins[i - 1] + tile - origin) if i > 0 else 0,
+             max(0, origin + tile - origins[i + 1]) if i + 1 < len(origins) else 0)
+            for i, origin in enumerate(origins)]
+
+
+def _ramp(length):
+    return np.linspace(1.0 / length, 1.0, length, dtype=np.float32)
+
+
+class TiledCanvas:
+    """Large master image built from overlapping tiles that are regenerated independently.
+
+    Each batch repaints a few tiles (round-robin) through `render_tile(tile_image,
+    prompt)`, concurrently, and every tile is blended into the master with linear
+    ramps over the overlaps it shares with its neighbours.
+    """
+
+    def __init__(self, path, size=CANVAS_SIZE, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+        self.path = path
+        self.width, self.height = size
+        self.tile_size = tile_size
+        self.overlap = overlap
+        xs = _origins(self.width, tile_size, overlap)
+        ys = _origins(self.height, tile_size, overlap)
+        self.tiles = [(x, y, x + tile_size, y + tile_size) for y in ys for x in xs]
+        # Pixels actually shared with the left/right/top/bottom neighbour; spreading the tiles
+        # evenly makes these wider than `overlap` (e.g. 320 and 456 at 3840x2160)
+        ox, oy = _overlaps(xs, tile_size), _overlaps(ys, tile_size)
+        self.overlaps = [ox[i] + oy[j] for j in range(len(ys)) for i in range(len(xs))]
+        self.next_tile = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Snapshot and write together, so an older state never lands last
+        if os.path.exists(path):
+            with Image.open(path) as img:
+                self.pixels = np.array(img.convert("RGB").resize(size, Image.LANCZOS))
+        else:
+            self.pixels = np.zeros((self.height, self.width, 3), dtype=np.uint8)  # Black background
+
+    def _weights(self, index):
+        # Ramp from 0 to 1 across each overlap that has a neighbour; canvas edges stay at 1
+        left, top, right, bottom = self.tiles[index]
+        wx = np.ones(right - left, dtype=np.float32)
+        wy = np.ones(bottom - top, dtype=np.float32)
+        for weights, before, after in ((wx,) + self.overlaps[index][:2], (wy,) + self.overlaps[index][2:]):
+            if before:
+                weights[:before] = _ramp(before)
+            if after:
+                weights[-after:] = np.minimum(weights[-after:], _ramp(after)[::-1])
+        return np.outer(wy, wx)[..., None]
+
+    def assign_tiles(self, count=TILES_PER_BATCH):
+        with self.lock:
+            chosen = [(self.next_tile + i) % len(self.tiles) for i in range(min(count, len(self.tiles)))]
+            self.next_tile = (self.next_tile + len(chosen)) % len(self.tiles)
+        return chosen
+
+    def tile_image(self, index):
+        left, top, right, bottom = self.tiles[index]
+        with self.lock:
+            return Image.fromarray(self.pixels[top:bottom, left:right].copy())
+
+    def blend_tile(self, index, image):
+        left, top, right, bottom = self.tiles[index]
+        tile = np.asarray(image.convert("RGB").resize((right - left, bottom - top), Image.LANCZOS), dtype=np.float32)
+        weights = self._weights(index)
+        with self.lock:
+            region = self.pixels[top:bottom, left:right].astype(np.float32)
+            self.pixels[top:bottom, left:right] = (region * (1 - weights) + tile * weights + 0.5).astype(np.uint8)
+
+    def update(self, prompt, render_tile, count=TILES_PER_BATCH):
+        """Repaint `count` tiles for one batch, in parallel, then save the master."""
+        indexes = self.assign_tiles(count)
+        with ThreadPoolExecutor(max_workers=min(MAX_TILE_WORKERS, len(indexes))) as executor:
+            rendered = executor.map(lambda i: (i, render_tile(self.tile_image(i), prompt)), indexes)
+            for index, image in rendered:
+                self.blend_tile(index, image)
+        return self.save()
+
+    def image(self, size=None):
+        with self.lock:
+            img = Image.fromarray(self.pixels.copy())
+        return img.resize(size, Image.LANCZOS) if size else img
+
+    def save(self, path=None):
+        with self.save_lock:
+            output = io.BytesIO()
+            self.image().save(output, format="JPEG", quality=92)
+            return write_atomic(path or self.path, [output.getvalue()])
+
+
+# Function to build a tile renderer that inpaints a tile in place with images.edit
+def edit_tile_renderer(client, border=TILE_OVERLAP // 2, response_format="b64_json"):
+    def render(tile, prompt):
+        size = f"{tile.width}x{tile.height}"
+        # Keep a thin opaque frame so the model continues whatever the neighbouring tiles show
+        mask = np.zeros((tile.height, tile.width, 4), dtype=np.uint8)
+        mask[:border, :, 3] = mask[-border:, :, 3] = 255
+        mask[:, :border, 3] = mask[:, -border:, 3] = 255
+        response = client.images.edit(
+            image=prepare_image(tile, size),
+            mask=prepare_mask(Image.fromarray(mask, "RGBA"), size),
+            prompt=prompt,
+            n=1,
+            size=size,
+            response_format=response_format,
+        )
+        with Image.open(io.BytesIO(image_bytes(response.data[0]))) as img:
+            return img.convert("RGB")
+    return render
@@ -0,0 +1,200 @@
+import argparse
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+from queue import Queue
+import numpy as np
+from PIL import Image
+
+##################################
+#########   Projector display feed
+##################################
+
+PROJECTOR_SIZE = (1920, 1080)
+FPS = 30
+CROSSFADE_SECONDS = 3.0
+POLL_INTERVAL = 0.5  # Seconds between checks for a new generated image
+
+
+# Function to decode an image once and letterbox it onto a black frame of `size`
+def fit_to_frame(path, size, out):
+    width, height = size
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        scale = min(width / img.width, height / img.height)
+        fitted = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+    left, top = (width - fitted.width) // 2, (height - fitted.height) // 2
+    out.fill(0)
+    out[top:top + fitted.height, left:left + fitted.width] = np.asarray(fitted)
+    return out
+
+
+class SharedMemorySink:
+    """Publishes frames to a named shared-memory block: 8-byte frame counter, then RGB pixels."""
+
+    def __init__(self, size=PROJECTOR_SIZE, name="collaborative_display"):
+        width, height = size
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=8 + width * height * 3)
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.counter = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf[:8])
+        self.pixels = np.ndarray((height, width, 3), dtype=np.uint8, buffer=self.shm.buf[8:])
+
+    def write(self, frame):
+        np.copyto(self.pixels, frame)
+        self.counter[0] += 1  # Readers copy the frame when the counter changes
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class WindowSink:
+    """Fullscreen window via pygame (optional dependency)."""
+
+    def __init__(self, size=PROJECTOR_SIZE, fullscreen=True):
+        import pygame
+        self.pygame = pygame
+        pygame.init()
+        flags = pygame.FULLSCREEN if fullscreen else 0
+        self.screen = pygame.display.set_mode(size, flags)
+        pygame.mouse.set_visible(False)
+
+    def write(self, frame):
+        for event in self.pygame.event.get():
+            if event.type == self.pygame.QUIT or (event.type == self.pygame.KEYDOWN and event.key == self.pygame.K_ESCAPE):
+                raise KeyboardInterrupt
+        # pygame surfaces are (width, height), so hand it the transposed view
+        self.pygame.surfarray.blit_array(self.screen, frame.swapaxes(0, 1))
+        self.pygame.display.flip()
+
+    def close(self):
+        self.pygame.quit()
+
+
+class DisplayFeed:
+    """Decodes each new image once and crossfades to it at a steady frame rate.
+
+    All frame memory is allocated up front: `shown` holds the image on screen,
+    `staging` receives the next decoded image, and the blend works in preallocated
+    float32 buffers, so producing a frame is two NumPy calls and a copy.
+    """
+
+    def __init__(self, sink, size=PROJECTOR_SIZE, fps=FPS, crossfade=CROSSFADE_SECONDS):
+        width, height = size
+        self.sink = sink
+        self.size = size
+        self.fps = fps
+        self.crossfade = crossfade
+        shape = (height, width, 3)
+        self.shown = np.zeros(shape, dtype=np.float32)
+        self.delta = np.zeros(shape, dtype=np.float32)
+        self.work = np.zeros(shape, dtype=np.float32)
+        self.frame = np.zeros(shape, dtype=np.uint8)
+        self.staging = np.zeros(shape, dtype=np.uint8)
+        self.staged = threading.Event()
+        self.pending = Queue()
+        self.fade_started = None
+        self.frames_late = 0
+        threading.Thread(target=self._decode_loop, daemon=True).start()
+
+    def show(self, path):
+        # Queue an image; decoding happens off the render thread
+        self.pending.put(path)
+
+    def _decode_loop(self):
+        while True:
+            path = self.pending.get()
+            while not self.pending.empty():
+                path = self.pending.get()  # Only the newest image matters
+            while self.staged.is_set():
+                time.sleep(1 / self.fps)  # Previous image not picked up yet
+            try:
+                fit_to_frame(path, self.size, self.staging)
+                self.staged.set()
+            except OSError as e:
+                print(f"Could not decode {path}: {e}")
+
+    def _start_fade(self, now):
+        if self.fade_started is not None:
+            # Interrupted mid-fade: continue from what is on screen right now
+            np.copyto(self.shown, self.work)
+        np.subtract(self.staging, self.shown, out=self.delta, dtype=np.float32)
+        self.staged.clear()
+        self.fade_started = now
+
+    def render(self, now):
+        if self.staged.is_set():
+            self._start_fade(now)
+        if self.fade_started is None:
+            return self.frame  # Static image; still pushed so the sink keeps a steady cadence
+        t = min(1.0, (now - self.fade_started) / self.crossfade)
+        t = t * t * (3 - 2 * t)  # Smoothstep easing
+        np.multiply(self.delta, t, out=self.work)
+        np.add(self.work, self.shown, out=self.work)
+        np.copyto(self.frame, self.work, casting="unsafe")
+        if t >= 1.0:
+            np.copyto(self.shown, self.work)
+            self.fade_started = None
+        return self.frame
+
+    def run(self):
+        interval = 1.0 / self.fps
+        deadline = time.monotonic()
+        try:
+            while True:
+                self.sink.write(self.render(deadline))
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Behind schedule: keep the fade on the wall clock instead of stretching it
+                    self.frames_late += 1
+                    deadline = time.monotonic()
+        finally:
+            self.sink.close()
+
+
+# Function to show each new image_N.jpeg as the sequence counter from ImageSequence advances,
+# and canvas.jpeg (CANVAS_MODE) whenever it is replaced, since the canvas never moves the counter
+def watch_folder(feed, folder, prefix="image_", suffix=".jpeg", canvas_name="canvas.jpeg"):
+    counter_path = os.path.join(folder, f".{prefix}sequence")
+    canvas_path = os.path.join(folder, canvas_name)
+    last = None
+    last_canvas = None
+    while True:
+        try:
+            with open(counter_path) as counter:
+                number = counter.read().strip()
+        except FileNotFoundError:
+            number = ""
+        path = os.path.join(folder, f"{prefix}{number}{suffix}")
+        if number and number != last and os.path.exists(path):
+            last = number
+            feed.show(path)
+        try:
+            # write_atomic renames a new file into place, so every update has a new inode
+            stat = os.stat(canvas_path)
+            canvas = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            canvas = None
+        if canvas and canvas != last_canvas:
+            last_canvas = canvas
+            feed.show(canvas_path)
+        time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crossfade new generated images onto the projector")
+    parser.add_argument("--folder", default="Generated_Images")
+    parser.add_argument("--shm", action="store_true", help="Publish frames to shared memory instead of a window")
+    parser.add_argument("--windowed", action="store_true")
+    args = parser.parse_args()
+
+    sink = SharedMemorySink() if args.shm else WindowSink(fullscreen=not args.windowed)
+    feed = DisplayFeed(sink)
+    threading.Thread(target=watch_folder, args=(feed, args.folder), daemon=True).start()
+    feed.run()
@@ -0,0 +1,130 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+##################################
+#########   Crash-safe input journal
+##################################
+
+QUEUE_FILE = "input_queue.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    station TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    enqueued REAL NOT NULL
+);
+"""
+
+
+class DurableQueue:
+    """Write-ahead journal for queued work: entries stay on disk until they are acked.
+
+    `put` only appends to an in-memory buffer and returns the entry's id, so it
+    costs microseconds; a committer thread writes everything buffered (new
+    entries and acks) in one SQLite WAL transaction with synchronous=FULL, i.e.
+    one fsync per group rather than per entry. While one group is being synced
+    the next one collects, so under load groups grow instead of piling up.
+    Whatever was put but not acked when the process died comes back from
+    `pending()` on the next start (at-least-once: work that finished just before
+    a crash may be replayed).
+    """
+
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")  # fsync on every commit; commits are batched
+        self.db.executescript(SCHEMA)
+        self.next_id = (self.db.execute("SELECT max(id) FROM jobs").fetchone()[0] or 0) + 1
+        self.outstanding = self.db.execute("SELECT count(*) FROM jobs").fetchone()[0]
+        self.puts = []
+        self.acks = []
+        self.submitted = 0  # Groups of changes handed to the committer
+        self.committed = 0
+        self.cond = threading.Condition()
+        self.running = True
+        self.committer = threading.Thread(target=self._commit_loop, name="durable-queue", daemon=True)
+        self.committer.start()
+        atexit.register(self.close)
+
+    def put(self, payload, station="local"):
+        """Journal one entry; returns its id for `ack`."""
+        with self.cond:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.outstanding += 1
+            self.puts.append((entry_id, station, json.dumps(payload), time.time()))
+            self.cond.notify()
+            return entry_id
+
+    def ack(self, ids):
+        """Mark entries as done; they will not be replayed."""
+        with self.cond:
+            self.acks.extend(ids)
+            self.outstanding -= len(ids)
+            self.cond.notify()
+
+    def _commit_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.puts or self.acks or not self.running)
+                if not (self.puts or self.acks):
+                    return
+                puts, self.puts = self.puts, []
+                acks, self.acks = self.acks, []
+                self.submitted += 1
+                group = self.submitted
+            try:
+                self.db.execute("BEGIN")
+                self.db.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)", puts)
+                self.db.executemany("DELETE FROM jobs WHERE id = ?", [(entry_id,) for entry_id in acks])
+                self.db.execute("COMMIT")
+            except sqlite3.Error as e:
+                print(f"Could not write input journal: {e}")
+                if self.db.in_transaction:
+                    self.db.execute("ROLLBACK")
+                with self.cond:
+                    if not self.running:
+                        return  # Unacked entries already on disk are replayed next start
+                    # Put the group back so the next commit retries it
+                    self.puts[:0] = puts
+                    self.acks[:0] = acks
+                time.sleep(0.5)
+                continue
+            with self.cond:
+                self.committed = group
+                self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until everything put or acked so far is on disk."""
+        with self.cond:
+            target = self.submitted + (1 if self.puts or self.acks else 0)
+            self.cond.wait_for(lambda: self.committed >= target or not self.committer.is_alive(), timeout)
+            return self.committed >= target
+
+    def pending(self):
+        """Entries not yet acked, oldest first, as (id, station, payload)."""
+        self.flush()
+        reader = sqlite3.connect(self.path)  # The committer owns the main connection
+        try:
+            rows = reader.execute("SELECT id, station, payload FROM jobs ORDER BY id").fetchall()
+        finally:
+            reader.close()
+        return [(entry_id, station, json.loads(payload)) for entry_id, station, payload in rows]
+
+    def __len__(self):
+        with self.cond:
+            return self.outstanding
+
+    def close(self):
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            self.cond.notify_all()
+        self.committer.join()
+        self.db.close()
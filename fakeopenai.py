@@ -0,0 +1,167 @@
+import argparse
+import base64
+import itertools
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+##################################
+#########   Offline stand-in for the OpenAI image and audio endpoints
+##################################
+
+# Point the scripts at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake
+
+DEFAULT_PORT = 8765
+FAKE_TRANSCRIPTIONS = [
+    "draw some trees",
+    "draw flying dogs",
+    "draw the city",
+    "add a rainbow over the park",
+    "put a giant cat on the moon",
+]
+
+
+# Function to build a solid-colour PNG with nothing but zlib
+def make_png(width, height, color=(20, 20, 20)):
+    row = b"\x00" + bytes(color) * width
+    raw = zlib.compress(row * height, 6)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+class FakeOpenAIServer:
+    """Serves images.generate / edit / create_variation and audio.transcriptions locally.
+
+    `latency` and `jitter` (seconds) shape how long each call takes; `error_rate`
+    makes that fraction of calls fail with a 500, or a 429 with Retry-After when
+    `rate_limit_errors` is set.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, image_latency=2.0, audio_latency=0.3, jitter=0.2,
+                 error_rate=0.0, rate_limit_errors=False, transcriptions=FAKE_TRANSCRIPTIONS):
+        self.port = port
+        self.latency = {"images": image_latency, "audio": audio_latency}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_errors = rate_limit_errors
+        self.transcriptions = itertools.cycle(transcriptions)
+        self.images = {}  # Served back for response_format="url"
+        self.pngs = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def _png(self, size):
+        with self.lock:
+            if size not in self.pngs:
+                width, height = (int(v) for v in size.split("x"))
+                self.pngs[size] = make_png(width, height)
+            return self.pngs[size]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=()):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _form_fields(self, body):
+                # Just enough multipart parsing for the small text fields we care about
+                fields = {}
+                if b"Content-Disposition" not in body:
+                    return json.loads(body or b"{}")
+                for part in body.split(b"Content-Disposition: form-data; name=\"")[1:]:
+                    name, _, rest = part.partition(b"\"")
+                    if b"filename=" in rest.split(b"\r\n", 1)[0]:
+                        continue
+                    value = rest.split(b"\r\n\r\n", 1)[-1].rsplit(b"\r\n--", 1)[0]
+                    fields[name.decode()] = value.decode("utf-8", errors="replace")
+                return fields
+
+            def do_GET(self):
+                image = server.images.get(self.path.rsplit("/", 1)[-1])
+                if image is None:
+                    return self._send(404, {"error": {"message": "not found"}})
+                self._send(200, image, "image/png")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                endpoint = self.path.split("/v1/", 1)[-1]
+                if endpoint not in ("images/generations", "images/edits", "images/variations", "audio/transcriptions"):
+                    return self._send(404, {"error": {"message": f"unknown endpoint {endpoint}"}})
+                with server.lock:
+                    server.counts[endpoint] = server.counts.get(endpoint, 0) + 1
+                group = endpoint.split("/")[0]
+                time.sleep(max(0.0, random.gauss(server.latency[group], server.jitter * server.latency[group])))
+
+                if random.random() < server.error_rate:
+                    if server.rate_limit_errors:
+                        return self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                          headers=[("Retry-After", "1")])
+                    return self._send(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+
+                fields = self._form_fields(body)
+                if group == "audio":
+                    return self._send(200, {"text": next(server.transcriptions)})
+
+                png = server._png(fields.get("size") or "1024x1024")
+                created = int(time.time())
+                if fields.get("response_format") == "b64_json":
+                    data = {"b64_json": base64.b64encode(png).decode("ascii")}
+                else:
+                    image_id = f"{created}-{random.getrandbits(32):08x}.png"
+                    server.images[image_id] = png
+                    data = {"url": f"http://127.0.0.1:{server.httpd.server_address[1]}/files/{image_id}"}
+                if endpoint == "images/generations":
+                    data["revised_prompt"] = fields.get("prompt", "")
+                self._send(200, {"created": created, "data": [data]})
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline OpenAI stand-in")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    parser.add_argument("--audio-latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-errors", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.port, args.image_latency, args.audio_latency,
+                              error_rate=args.error_rate, rate_limit_errors=args.rate_limit_errors)
+    print(f"Fake OpenAI listening on {server.base_url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from imagefetch import write_atomic
+from metrics import metrics
+
+##################################
+#########   Prompt-keyed generation cache
+##################################
+
+CACHE_FOLDER = "Generation_Cache"
+MAX_CACHE_BYTES = 500 * 1024 * 1024
+MAX_CACHE_AGE = 14 * 24 * 3600  # Seconds
+
+
+# Function to normalize a prompt so trivially different spellings share a cache entry
+def normalize_prompt(prompt):
+    return " ".join(prompt.casefold().split())
+
+
+class GenerationCache:
+    """Generated images on disk, keyed by normalized prompt + model + size + mode.
+
+    The index lives in memory as an LRU-ordered dict and is persisted to
+    index.json when entries are added or evicted. Entries are evicted by age and
+    when the folder grows past `max_bytes`, least recently used first.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(folder, "index.json")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as file:
+                entries = json.load(file)
+        self.entries = OrderedDict(sorted(entries.items(), key=lambda item: item[1]["last_used"]))
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+        for name in ("entries", "bytes", "hits", "misses"):
+            metrics.gauge(f"generation_cache_{name}", lambda name=name: self.stats()[name])
+
+    @staticmethod
+    def key(prompt, model, size, mode="generate", image_path=None):
+        digest = hashlib.sha256()
+        for part in (normalize_prompt(prompt), model or "", size, mode):
+            digest.update(part.encode("utf-8") + b"\0")
+        if image_path:
+            # Edits and variations also depend on the image they start from
+            with open(image_path, "rb") as image_file:
+                digest.update(hashlib.sha256(image_file.read()).digest())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.img")
+
+    def get(self, key):
+        """The cached image bytes, or None on a miss (unknown, expired or missing file); counts both."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry["created"] > self.max_age:
+                self._remove(key)
+                entry = None
+            data = None
+            if entry is not None:
+                try:
+                    with open(self._path(key), "rb") as image_file:
+                        data = image_file.read()
+                except OSError:
+                    self._remove(key)  # File deleted behind the index's back
+            if data is None:
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def restore(self, key, filepath):
+        """Write a cached image to `filepath`; returns the path on a hit, None on a miss.
+
+        `filepath` may be a function returning the path, called only on a hit, so
+        callers can allocate the next image number only when there is an image.
+        """
+        data = self.get(key)
+        if data is None:
+            return None
+        filepath = filepath() if callable(filepath) else filepath
+        write_atomic(filepath, [data])
+        print(f"Cache hit, image saved as {filepath}")
+        return filepath
+
+    def put(self, key, filepath):
+        with open(filepath, "rb") as image_file:
+            data = image_file.read()
+        write_atomic(self._path(key), [data])
+        now = time.time()
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries[key]["size"]
+            self.entries[key] = {"size": len(data), "created": now, "last_used": now}
+            self.entries.move_to_end(key)
+            self.total_bytes += len(data)
+            self._evict(now)
+            self._save_index()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["size"]
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def _evict(self, now):
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.max_age]:
+            self._remove(key)
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+
+    def _save_index(self):
+        write_atomic(self.index_path, [json.dumps(self.entries).encode("utf-8")])
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,94 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+##################################
+#########   Input history
+##################################
+
+FLUSH_EVERY = 4  # Buffered lines that trigger a write
+FLUSH_INTERVAL = 5.0  # Seconds before buffered lines are written anyway
+MAX_FILE_BYTES = 256 * 1024  # Compact the journal once it grows past this
+KEEP_LINES = 1000  # Lines kept when compacting
+
+
+# Function to read the last `count` lines of a file by seeking backwards from the end
+def read_tail(path, count, block_size=4096):
+    if count <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(block_size, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+    lines = [line.strip() for line in data.decode("utf-8", errors="replace").splitlines()]
+    return [line for line in lines if line][-count:]
+
+
+class HistoryStore:
+    """Recent inputs kept in memory, with history.txt as an append-only journal.
+
+    `add` never reads the file: it updates the in-memory window and buffers the
+    new lines, which are appended in batches. On start-up only the tail of the
+    journal is read, and the journal is compacted to its last KEEP_LINES lines
+    when it passes MAX_FILE_BYTES.
+    """
+
+    def __init__(self, path, max_lines, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL,
+                 max_file_bytes=MAX_FILE_BYTES, keep_lines=KEEP_LINES):
+        self.path = path
+        self.recent = deque(read_tail(path, max_lines), maxlen=max_lines)
+        self.pending = []
+        self.flush_every = flush_every
+        self.max_file_bytes = max_file_bytes
+        self.keep_lines = max(keep_lines, max_lines)
+        self.lock = threading.Lock()
+        threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True).start()
+        atexit.register(self.flush)
+
+    def add(self, new_inputs):
+        """Record new inputs and return the recent window, newest last."""
+        with self.lock:
+            for line in new_inputs:
+                line = " ".join(line.split())  # One entry per journal line
+                self.recent.append(line)
+                self.pending.append(line)
+            recent = list(self.recent)
+            if len(self.pending) >= self.flush_every:
+                self._flush()
+        return recent
+
+    def get(self):
+        with self.lock:
+            return list(self.recent)
+
+    def _flush(self):
+        if not self.pending:
+            return
+        with open(self.path, "a") as file:
+            file.write("".join(f"{line}\n" for line in self.pending))
+        self.pending = []
+        if os.path.getsize(self.path) > self.max_file_bytes:
+            self._compact()
+
+    def _compact(self):
+        lines = read_tail(self.path, self.keep_lines)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write("".join(f"{line}\n" for line in lines))
+        os.replace(temp_path, self.path)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush_periodically(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
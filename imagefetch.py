@@ -0,0 +1,80 @@
+import base64
+import os
+import tempfile
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import metrics
+
+##################################
+#########   Image download and save
+##################################
+
+DOWNLOAD_TIMEOUT = (5, 60)  # Seconds to connect, seconds between received bytes
+CHUNK_SIZE = 64 * 1024
+RESPONSE_FORMAT = "b64_json"  # Image bytes inline in the API response, no second HTTP hop
+
+# mkstemp creates files as 0600; saved images get the usual 0666 minus the umask instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+# One keep-alive session for every download in the process
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+# Function to write chunks to a temp file next to `filepath` and rename it into place;
+# with overwrite=False an existing file is never replaced (FileExistsError instead),
+# with fsync=True the data is on disk before the name appears, so a crash leaves no empty image
+def write_atomic(filepath, chunks, overwrite=True, fsync=True):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".", prefix=".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as handler:
+            if hasattr(os, "fchmod"):
+                os.fchmod(handler.fileno(), FILE_MODE)
+            for chunk in chunks:
+                handler.write(chunk)
+            if fsync:
+                handler.flush()
+                os.fsync(handler.fileno())
+        if overwrite:
+            os.replace(temp_path, filepath)
+        else:
+            os.link(temp_path, filepath)  # Fails if the name is taken, unlike rename
+            os.unlink(temp_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return filepath
+
+
+# Function to stream an image URL to disk without buffering the whole body
+def download_image(image_url, filepath, timeout=DOWNLOAD_TIMEOUT, overwrite=True):
+    with session.get(image_url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        write_atomic(filepath, response.iter_content(CHUNK_SIZE), overwrite)
+    return filepath
+
+
+# Function to get the raw bytes of one entry of an images API response, for post-processing
+def image_bytes(image, timeout=DOWNLOAD_TIMEOUT):
+    if getattr(image, "b64_json", None):
+        return base64.b64decode(image.b64_json)
+    with metrics.span("download"):
+        response = session.get(image.url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+
+# Function to save one entry of an images API response, whichever format it came back in
+def save_image(image, filepath, overwrite=True):
+    if getattr(image, "b64_json", None):
+        with metrics.span("save"):
+            write_atomic(filepath, [base64.b64decode(image.b64_json)], overwrite)
+    else:
+        # Streaming writes as it downloads, so both happen in one span
+        with metrics.span("download"):
+            download_image(image.url, filepath, overwrite=overwrite)
+    print(f"Image saved as {filepath}")
+    return filepath
@@ -0,0 +1,82 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+##################################
+#########   In-memory image and mask preparation for images.edit
+##################################
+
+PNG_COMPRESS_LEVEL = 1  # The API re-encodes anyway; favour speed over size
+
+
+# Function to turn "1024x1024" into (1024, 1024)
+def parse_size(size):
+    width, height = size.split("x")
+    return int(width), int(height)
+
+
+# Function to convert a PIL image to RGBA at the API's target size
+def to_rgba(img, size):
+    target = parse_size(size) if isinstance(size, str) else size
+    img = img.convert("RGBA")
+    if img.size != target:
+        img = img.resize(target, Image.LANCZOS)
+    return img
+
+
+# Function to encode a PIL image as PNG bytes without touching the disk
+def encode_png(img):
+    png_io = io.BytesIO()
+    img.save(png_io, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return png_io.getvalue()
+
+
+# Function to wrap PNG bytes in the (filename, bytes, content type) tuple the OpenAI SDK uploads
+def as_upload(data, name="image.png"):
+    return (name, data, "image/png")
+
+
+class PreparedImageCache:
+    """RGBA PNG uploads keyed by source file, modification time and size.
+
+    The canvas changes once per generation but may be edited several times in
+    between (retries, concurrent tiles), so it is converted once and reused.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, size):
+        key = (os.path.realpath(path), os.stat(path).st_mtime_ns, size)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        with Image.open(path) as img:
+            data = encode_png(to_rgba(img, size))
+        with self.lock:
+            self.entries[key] = data
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return data
+
+
+prepared_images = PreparedImageCache()
+
+
+# Function to get the upload for an edit's base image
+def prepare_image(source, size):
+    if isinstance(source, Image.Image):
+        return as_upload(encode_png(to_rgba(source, size)))
+    return as_upload(prepared_images.get(source, size))
+
+
+# Function to get the upload for an edit mask; transparent pixels mark the area to repaint
+def prepare_mask(source, size):
+    if isinstance(source, Image.Image):
+        return as_upload(encode_png(to_rgba(source, size)), "mask.png")
+    return as_upload(prepared_images.get(source, size), "mask.png")
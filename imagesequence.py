@@ -0,0 +1,73 @@
+import os
+import re
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+##################################
+#########   Image filename allocation
+##################################
+
+
+class ImageSequence:
+    """Hands out image_1.jpeg, image_2.jpeg, ... from a counter file in the folder.
+
+    Each allocation reads and bumps one small file under an exclusive lock, so it
+    costs the same with ten images or ten thousand, and concurrent threads or
+    processes never get the same number. The folder is only scanned when the
+    counter file does not exist yet.
+    """
+
+    def __init__(self, folder, prefix="image_", suffix=".jpeg"):
+        self.folder = folder
+        self.prefix = prefix
+        self.suffix = suffix
+        self.counter_path = os.path.join(folder, f".{prefix}sequence")
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _scan(self):
+        # One-off migration from the listdir-based numbering
+        pattern = re.compile(rf"^{re.escape(self.prefix)}(\d+){re.escape(self.suffix)}$")
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.folder)) if m]
+        return max(numbers, default=0)
+
+    def _path(self, number):
+        return os.path.join(self.folder, f"{self.prefix}{number}{self.suffix}")
+
+    def next_number(self):
+        with self.lock:
+            fd = os.open(self.counter_path, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, "r+") as counter:
+                if fcntl:
+                    fcntl.flock(counter, fcntl.LOCK_EX)
+                value = counter.read().strip()
+                number = (int(value) if value else self._scan()) + 1
+                # Guards against a counter that lost its last update in a power cut
+                while os.path.exists(self._path(number)):
+                    number += 1
+                counter.seek(0)
+                counter.truncate()
+                counter.write(str(number))
+                counter.flush()
+                return number  # Closing the file releases the flock
+
+    def next_filename(self):
+        return f"{self.prefix}{self.next_number()}{self.suffix}"
+
+    def save_new(self, write, attempts=10):
+        """Allocate the next path and call `write(path)`, which must refuse to overwrite.
+
+        A FileExistsError means something outside the counter took that name
+        (another tool, a restored backup), so the next number is tried instead.
+        """
+        for _ in range(attempts):
+            path = self._path(self.next_number())
+            try:
+                return write(path)
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"No free {self.prefix}N{self.suffix} name in {self.folder} after {attempts} attempts")
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from imagefetch import write_atomic
+
+##################################
+#########   Content-addressed image store
+##################################
+
+STORE_FOLDER = "Image_Store"
+MAX_LINEAGE_DEPTH = 1000
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+# One generation: the image's content hash and where it lives, plus what produced it
+ImageRecord = namedtuple("ImageRecord", "digest path prompt inputs parent mode model created")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL REFERENCES images(digest),
+    prompt TEXT,
+    inputs TEXT,
+    parent TEXT,
+    mode TEXT NOT NULL,
+    model TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_digest ON generations(digest, id);
+CREATE INDEX IF NOT EXISTS generations_mode ON generations(mode, id);
+CREATE INDEX IF NOT EXISTS generations_parent ON generations(parent);
+"""
+
+_COLUMNS = "g.digest, i.path, g.prompt, g.inputs, g.parent, g.mode, g.model, g.created"
+
+
+def _record(row):
+    digest, path, prompt, inputs, parent, mode, model, created = row
+    return ImageRecord(digest, path, prompt, json.loads(inputs) if inputs else [], parent, mode, model, created)
+
+
+class ImageStore:
+    """Images saved once under their SHA-256, with a SQLite index of how each was made.
+
+    Identical bytes are stored once however often they are generated or restored
+    from the cache; every generation still gets its own row with prompt, inputs,
+    parent image, mode and time. "Latest image" and "lineage of image X" are
+    indexed queries, so nothing scans or stats the image folders.
+    """
+
+    def __init__(self, folder=STORE_FOLDER):
+        self.folder = folder
+        self.objects = os.path.join(folder, "objects")
+        os.makedirs(self.objects, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(folder, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers in other processes never block the writer
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def _object_path(self, digest, suffix):
+        return os.path.join(self.objects, digest[:2], f"{digest}{suffix}")
+
+    def _store_object(self, digest, data, suffix, source=None):
+        row = self.db.execute("SELECT path FROM images WHERE digest = ?", (digest,)).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]  # Already stored
+        path = self._object_path(digest, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # Hard-link the file we were given instead of writing a second copy
+            if source is None:
+                raise OSError
+            if os.path.exists(path):
+                os.unlink(path)
+            os.link(source, path)
+        except OSError:
+            write_atomic(path, [data])
+        self.db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)", (digest, path, len(data), time.time()))
+        return path
+
+    def put(self, data, prompt=None, inputs=(), parent=None, mode="generate", model=None, suffix=".jpeg",
+            created=None, source=None):
+        """Store image bytes and record the generation; returns its ImageRecord."""
+        digest = hashlib.sha256(data).hexdigest()
+        created = time.time() if created is None else created
+        inputs = list(inputs)
+        with self.lock, self.db:
+            path = self._store_object(digest, data, suffix, source)
+            self.db.execute(
+                "INSERT INTO generations (digest, prompt, inputs, parent, mode, model, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, prompt, json.dumps(inputs), parent, mode, model, created),
+            )
+        return ImageRecord(digest, path, prompt, inputs, parent, mode, model, created)
+
+    def add_file(self, filepath, **details):
+        """Record an image that was already saved to `filepath` (hard-linked into the store when possible)."""
+        with open(filepath, "rb") as image_file:
+            data = image_file.read()
+        suffix = os.path.splitext(filepath)[1].lower() or ".jpeg"
+        return self.put(data, suffix=suffix, source=filepath, **details)
+
+    def get(self, digest):
+        rows = self._query(
+            f"SELECT {_COLUMNS} FROM generations g JOIN images i USING (digest) "
+            "WHERE g.digest = ? ORDER BY g.id DESC LIMIT 1", (digest,)
+        )
+        return _record(rows[0]) if rows else None
+
+    def latest(self, mode=None):
+        """Most recent generation, optionally of one mode ("generate", "variation", ...) or a tuple of modes."""
+        query = f"SELECT {_COLUMNS} FROM generations g JOIN images i USING (digest)"
+        if mode is None:
+            rows = self._query(f"{query} ORDER BY g.id DESC LIMIT 1")
+        else:
+            modes = (mode,) if isinstance(mode, str) else tuple(mode)
+            placeholders = ", ".join("?" * len(modes))
+            rows = self._query(f"{query} WHERE g.mode IN ({placeholders}) ORDER BY g.id DESC LIMIT 1", modes)
+        return _record(rows[0]) if rows else None
+
+    def lineage(self, digest, max_depth=MAX_LINEAGE_DEPTH):
+        """The image and its ancestors through `parent`, newest first."""
+        rows = self._query(
+            f"""
+            WITH RECURSIVE chain(id, depth) AS (
+                SELECT max(id), 0 FROM generations WHERE digest = ?
+                UNION ALL
+                -- The parent's generation is the newest one before this one, so ids only go down
+                SELECT (SELECT max(p.id) FROM generations p WHERE p.digest = g.parent AND p.id < g.id), chain.depth + 1
+                FROM chain JOIN generations g ON g.id = chain.id
+                WHERE g.parent IS NOT NULL AND chain.depth < ?
+            )
+            SELECT {_COLUMNS} FROM chain JOIN generations g ON g.id = chain.id JOIN images i USING (digest)
+            ORDER BY chain.depth
+            """,
+            (digest, max_depth),
+        )
+        return [_record(row) for row in rows]
+
+    def children(self, digest):
+        rows = self._query(
+            f"SELECT {_COLUMNS} FROM generations g JOIN images i USING (digest) WHERE g.parent = ? ORDER BY g.id",
+            (digest,),
+        )
+        return [_record(row) for row in rows]
+
+    def search(self, text, limit=20):
+        """Generations whose prompt or inputs mention `text`, newest first."""
+        pattern = f"%{text}%"
+        rows = self._query(
+            f"SELECT {_COLUMNS} FROM generations g JOIN images i USING (digest) "
+            "WHERE g.prompt LIKE ? OR g.inputs LIKE ? ORDER BY g.id DESC LIMIT ?",
+            (pattern, pattern, limit),
+        )
+        return [_record(row) for row in rows]
+
+    def import_folder(self, folder, mode="imported"):
+        """One-off migration of an existing image folder, oldest first so `latest` stays right."""
+        if not os.path.isdir(folder):
+            return 0
+        paths = [os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(IMAGE_SUFFIXES)]
+        paths.sort(key=os.path.getmtime)
+        for path in paths:
+            self.add_file(path, mode=mode, created=os.path.getmtime(path))
+        return len(paths)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,106 @@
+import re
+import threading
+import time
+from collections import deque
+from metrics import metrics
+
+##################################
+#########   Duplicate and no-speech suppression before batching
+##################################
+
+NO_SPEECH_THRESHOLD = 0.6  # Whisper's own defaults for skipping a segment as silence
+LOGPROB_THRESHOLD = -1.0
+SIMILARITY_THRESHOLD = 0.75  # Trigram Jaccard similarity that counts as "said again"
+RECENT_WINDOW = 50  # Accepted inputs compared against
+RECENT_SECONDS = 300.0  # A repeat after this long is a new contribution
+MIN_CHARACTERS = 3  # Normalized text shorter than this is noise
+
+# What Whisper tends to produce for near-silent windows (normalized)
+FILLER_PHRASES = frozenset({
+    "you", "thank you", "thanks", "thank you very much", "thanks for watching", "thank you for watching",
+    "bye", "okay", "ok", "so", "uh", "um", "hmm", "mm", "oh", "the end",
+    "please subscribe", "subtitles by the amara org community",
+})
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+# Function to normalize a transcription for comparison: case, punctuation and whitespace
+def normalize_text(text):
+    return " ".join(_PUNCTUATION.sub(" ", text.casefold()).split())
+
+
+# Function to split normalized text into the set of its character trigrams
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+# Function to keep only the Whisper segments that are not silence, as Whisper itself would
+def speech_text(transcript, no_speech_threshold=NO_SPEECH_THRESHOLD, logprob_threshold=LOGPROB_THRESHOLD):
+    if not transcript.segments:
+        return transcript.text
+    kept = [
+        text for text, no_speech_prob, avg_logprob in transcript.segments
+        if not (no_speech_prob > no_speech_threshold and avg_logprob < logprob_threshold)
+    ]
+    return " ".join(text.strip() for text in kept).strip()
+
+
+class InputFilter:
+    """Drops transcriptions that would only repeat an input or describe silence.
+
+    `accept` takes a plain string or a Transcript and returns the text to queue, or
+    None. Silence is detected from Whisper's per-segment no_speech_prob /
+    avg_logprob when the engine reports them, plus a list of the filler phrases
+    Whisper invents for quiet audio. Repeats are found by trigram Jaccard
+    similarity against the last RECENT_WINDOW accepted inputs of the past
+    RECENT_SECONDS, so each check costs at most one set comparison per recent input.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, window=RECENT_WINDOW, max_age=RECENT_SECONDS,
+                 min_characters=MIN_CHARACTERS, fillers=FILLER_PHRASES):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.min_characters = min_characters
+        self.fillers = fillers
+        self.recent = deque(maxlen=window)  # (accepted_at, normalized, trigrams)
+        self.lock = threading.RLock()
+        self.counts = {"accepted": 0, "empty": 0, "no_speech": 0, "filler": 0, "duplicate": 0}
+
+    def _reject(self, reason, text):
+        with self.lock:
+            self.counts[reason] += 1
+        metrics.inc("inputs_suppressed_total", reason=reason)
+        if text:
+            print(f"Skipping input ({reason}): {text}")
+        return None
+
+    def accept(self, transcript):
+        if isinstance(transcript, str):
+            text = transcript.strip()
+        else:
+            text = speech_text(transcript)
+            if transcript.text.strip() and not text:
+                return self._reject("no_speech", transcript.text.strip())
+        normalized = normalize_text(text)
+        if len(normalized) < self.min_characters:
+            return self._reject("empty", text)
+        if normalized in self.fillers:
+            return self._reject("filler", text)
+
+        grams = trigrams(normalized)
+        now = time.monotonic()
+        with self.lock:
+            while self.recent and now - self.recent[0][0] > self.max_age:
+                self.recent.popleft()
+            for _, previous, previous_grams in self.recent:
+                if previous == normalized or len(grams & previous_grams) >= self.threshold * len(grams | previous_grams):
+                    return self._reject("duplicate", text)
+            self.recent.append((now, normalized, grams))
+            self.counts["accepted"] += 1
+        return text
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
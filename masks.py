@@ -0,0 +1,100 @@
+from collections import namedtuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+
+##################################
+#########   Region-targeted edit masks
+##################################
+
+TILE_SIZE = 256  # Mask granularity on the canvas
+CROP_SIZE = 512  # Size of the region sent to images.edit
+FEATHER = 16  # Pixels of blending where an edited crop meets the old canvas
+
+# box: (left, top, right, bottom) on the canvas; crop/mask: PIL images sent to the API;
+# weights: float array, 1 where the edit replaces the canvas
+EditPlan = namedtuple("EditPlan", "box crop mask weights")
+
+
+# Function to measure how much detail each tile holds (mean gradient magnitude)
+def tile_energy(pixels, tile_size=TILE_SIZE):
+    gray = pixels[..., :3].astype(np.float32).mean(axis=2)
+    energy = np.abs(np.diff(gray, axis=1, append=gray[:, -1:])) + np.abs(np.diff(gray, axis=0, append=gray[-1:, :]))
+    rows, cols = gray.shape[0] // tile_size, gray.shape[1] // tile_size
+    energy = energy[:rows * tile_size, :cols * tile_size]
+    return energy.reshape(rows, tile_size, cols, tile_size).mean(axis=(1, 3))
+
+
+# Function to soften a 0/1 weight map with a separable box blur (cumulative sums, no loops over pixels)
+def feather(weights, radius=FEATHER):
+    if radius <= 0:
+        return weights
+    size = 2 * radius + 1
+    for axis in (0, 1):
+        padded = np.pad(weights, [(radius, radius) if a == axis else (0, 0) for a in (0, 1)], mode="edge")
+        summed = np.cumsum(padded, axis=axis, dtype=np.float64)
+        summed = np.insert(summed, 0, 0, axis=axis)
+        upper = np.take(summed, np.arange(size, summed.shape[axis]), axis=axis)
+        lower = np.take(summed, np.arange(0, summed.shape[axis] - size), axis=axis)
+        weights = (upper - lower) / size
+    return weights.astype(np.float32)
+
+
+def plan_edit(canvas, input_count, strategy="energy", slot=0, tile_size=TILE_SIZE, crop_size=CROP_SIZE):
+    """Pick the crop and the tiles inside it that the next batch repaints.
+
+    "energy" picks the crop window with the least detail and, inside it, the
+    `input_count` flattest tiles; "rotate" walks the crop windows in turn using
+    `slot` (e.g. the batch number). Only the chosen tiles are transparent in the mask.
+    """
+    canvas = canvas.convert("RGBA")
+    pixels = np.asarray(canvas)
+    crop_size = min(crop_size, canvas.width, canvas.height)
+    span = max(1, crop_size // tile_size)
+    energy = tile_energy(pixels, tile_size)
+    windows = sliding_window_view(energy, (span, span)).sum(axis=(2, 3))
+
+    if strategy == "rotate":
+        row, col = divmod(slot % windows.size, windows.shape[1])
+    else:
+        row, col = np.unravel_index(np.argmin(windows), windows.shape)
+
+    # Flattest tiles inside the window, one per input (at least one, at most all)
+    window_energy = energy[row:row + span, col:col + span]
+    count = int(np.clip(input_count, 1, span * span))
+    chosen = np.argsort(window_energy, axis=None)[:count]
+
+    weights = np.zeros((crop_size, crop_size), dtype=np.float32)
+    for index in chosen:
+        r, c = divmod(int(index), span)
+        weights[r * tile_size:(r + 1) * tile_size, c * tile_size:(c + 1) * tile_size] = 1.0
+
+    mask = np.full((crop_size, crop_size, 4), 255, dtype=np.uint8)
+    mask[..., 3] = np.where(weights > 0, 0, 255)  # Transparent = area the API may repaint
+
+    left, top = int(col) * tile_size, int(row) * tile_size
+    box = (left, top, left + crop_size, top + crop_size)
+    # The model never saw past the crop, so where a crop edge lies inside the canvas the blend
+    # must reach 0 at that edge: keep the blended region inset by more than the blur radius
+    inset = FEATHER + 1
+    if left > 0:
+        weights[:, :inset] = 0
+    if top > 0:
+        weights[:inset, :] = 0
+    if box[2] < canvas.width:
+        weights[:, crop_size - inset:] = 0
+    if box[3] < canvas.height:
+        weights[crop_size - inset:, :] = 0
+    return EditPlan(box, canvas.crop(box), Image.fromarray(mask, "RGBA"), feather(weights))
+
+
+# Function to blend an edited crop back into the canvas, only inside the planned region
+def apply_edit(canvas, plan, edited):
+    canvas = canvas.convert("RGBA")
+    size = (plan.box[2] - plan.box[0], plan.box[3] - plan.box[1])
+    edited = np.asarray(edited.convert("RGBA").resize(size, Image.LANCZOS), dtype=np.float32)
+    original = np.asarray(plan.crop, dtype=np.float32)
+    weights = plan.weights[..., None]
+    blended = original * (1 - weights) + edited * weights
+    canvas.paste(Image.fromarray(np.clip(blended + 0.5, 0, 255).astype(np.uint8), "RGBA"), plan.box[:2])
+    return canvas
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+##################################
+#########   Pipeline metrics
+##################################
+
+# Upper bounds in seconds; covers a VAD frame up to a slow image call
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_JSONL = os.getenv("METRICS_JSONL", "")  # e.g. "metrics.jsonl"; empty disables the file export
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format(name, labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class JsonlExporter:
+    """Buffers events and appends them to a JSONL file, rotating it at `max_bytes`."""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3, interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, args=(interval,), daemon=True).start()
+
+    def record(self, event):
+        with self.lock:
+            self.buffer.append(event)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def flush(self):
+        with self.lock:
+            events, self.buffer = self.buffer, []
+        if not events:
+            return
+        with open(self.path, "a") as file:
+            file.write("".join(json.dumps(event) + "\n" for event in events))
+        if os.path.getsize(self.path) > self.max_bytes:
+            self._rotate()
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+
+class Metrics:
+    """Counters, gauges and latency histograms, exported as Prometheus text or JSONL.
+
+    Recording is a dict lookup and a bisect under one lock, cheap enough to leave on.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}  # Values or zero-argument callables read at export time
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.exporter = None
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def span(self, stage):
+        """Time a pipeline stage: latency histogram, ok/error counter, optional JSONL event."""
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("pipeline_stage_seconds", elapsed, stage=stage)
+            self.inc("pipeline_stage_total", stage=stage, status=status)
+            if self.exporter:
+                self.exporter.record({"ts": time.time(), "stage": stage, "seconds": round(elapsed, 6), "status": status})
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self.histograms.items()}
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f"{_format(name, labels)} {value}")
+        for (name, labels), value in sorted(gauges.items(), key=lambda item: item[0]):
+            lines.append(f"{_format(name, labels)} {value() if callable(value) else value}")
+        for (name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{_format(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{_format(name + '_sum', labels)} {total}")
+            lines.append(f"{_format(name + '_count', labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        except OSError as e:
+            # Another script already serves on this port; keep running without the endpoint
+            print(f"Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        print(f"Metrics on http://127.0.0.1:{httpd.server_address[1]}/metrics")
+        return httpd
+
+    def export_jsonl(self, path=METRICS_JSONL, **options):
+        self.exporter = JsonlExporter(path, **options)
+        return self.exporter
+
+
+# Shared registry for the process
+metrics = Metrics()
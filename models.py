@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import time
+
+##################################
+#########   Lazy model loading from a local cache
+##################################
+
+# Taken when this module is imported, which is the first thing the listeners do
+STARTUP_TIME = time.perf_counter()
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+SILERO_VAD_REPO = "snakers4/silero-vad"
+SILERO_VAD_TAG = "v5.1"  # Pinned so an offline cache always matches the code
+
+
+def _silero_hub_dir(cache_dir):
+    # Same directory name torch.hub uses for "<owner>/<repo>:<tag>"
+    owner, repo = SILERO_VAD_REPO.split("/")
+    return os.path.join(cache_dir, "hub", f"{owner}_{repo}_{SILERO_VAD_TAG}")
+
+
+class ModelManager:
+    """Imports torch/whisper/silero only when first needed and loads weights offline.
+
+    `warm()` starts loading in a background thread so capture can begin at once;
+    `vad()` / `whisper()` block only if the model is not ready yet.
+    """
+
+    def __init__(self, cache_dir=MODEL_CACHE_DIR, whisper_name=WHISPER_MODEL):
+        self.cache_dir = cache_dir
+        self.whisper_name = whisper_name
+        self.timings = {}
+        self._models = {}
+        self._locks = {"vad": threading.Lock(), "whisper": threading.Lock()}
+        self._loaders = {"vad": self._load_vad, "whisper": self._load_whisper}
+
+    def _get(self, name):
+        with self._locks[name]:
+            if name not in self._models:
+                started = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self.timings[name] = time.perf_counter() - started
+            return self._models[name]
+
+    def _load_vad(self):
+        try:
+            # The pip package ships the JIT weights, no hub lookup at all
+            from silero_vad import load_silero_vad
+            import silero_vad
+            utils = (silero_vad.get_speech_timestamps, silero_vad.save_audio, silero_vad.read_audio,
+                     silero_vad.VADIterator, silero_vad.collect_chunks)
+            return load_silero_vad(), utils
+        except ImportError:
+            import torch
+            repo_dir = _silero_hub_dir(self.cache_dir)
+            if not os.path.isdir(repo_dir):
+                raise FileNotFoundError(f"Silero VAD not cached in {repo_dir}, run `python models.py --download` once")
+            return torch.hub.load(repo_or_dir=repo_dir, model='silero_vad', source='local', trust_repo=True)
+
+    def _load_whisper(self):
+        import whisper
+        whisper_dir = os.path.join(self.cache_dir, "whisper")
+        if not os.path.exists(os.path.join(whisper_dir, f"{self.whisper_name}.pt")):
+            raise FileNotFoundError(f"Whisper '{self.whisper_name}' not cached in {whisper_dir}, run `python models.py --download` once")
+        return whisper.load_model(self.whisper_name, download_root=whisper_dir)
+
+    def vad(self):
+        # (model, utils) in the same shape torch.hub.load returns
+        return self._get("vad")
+
+    def whisper(self):
+        return self._get("whisper")
+
+    def _load_all(self, names):
+        for name in names:
+            self._get(name)
+
+    def warm(self, *names):
+        thread = threading.Thread(target=self._load_all, args=(names or tuple(self._loaders),), daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        loaded = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+        print(f"Startup: ready after {time.perf_counter() - STARTUP_TIME:.2f}s ({loaded or 'no models loaded yet'})")
+
+
+# Function to fetch the pinned models into the cache; the only step that needs the network
+def download_models(cache_dir=MODEL_CACHE_DIR, whisper_name=WHISPER_MODEL):
+    import torch
+    import whisper
+    torch.hub.set_dir(os.path.join(cache_dir, "hub"))
+    torch.hub.load(f"{SILERO_VAD_REPO}:{SILERO_VAD_TAG}", model='silero_vad', source='github', trust_repo=True)
+    whisper.load_model(whisper_name, download_root=os.path.join(cache_dir, "whisper"))
+    print(f"Models cached in {cache_dir}")
+
+
+# Shared manager for the process
+model_manager = ModelManager()
+
+
+if __name__ == "__main__":
+    if "--download" in sys.argv:
+        download_models()
+    else:
+        model_manager.warm().join()
+        model_manager.report()
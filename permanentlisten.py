@@ -1,167 +1,234 @@
 from openai import OpenAI
+from ratelimit import RateLimitedClient
 import os
-import requests
-import sounddevice as sd
-import speech_recognition as sr
+from imagesequence import ImageSequence
+from history import HistoryStore
+from promptbuilder import PromptBuilder, DALLE2_PROMPT_TOKENS, DALLE2_PROMPT_CHARS
+from gencache import GenerationCache
+from imagestore import ImageStore
 import threading
-from queue import Queue
-from scipy.io.wavfile import write
 from dotenv import load_dotenv
-from collections import deque
 import time
-import numpy as np
+from audiocapture import get_microphone
+from transcription import create_engine
+from inputfilter import InputFilter
+from stations import StationQueues, StationIntake, LOCAL_STATION
+from durablequeue import DurableQueue
+from scheduler import GenerationScheduler, SpeculativeBatcher
+from metrics import metrics, METRICS_PORT, METRICS_JSONL
+from canvas import TiledCanvas, edit_tile_renderer
+from pipeline import ImagePipeline
 
 # Load environment variables
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Rate limited with retries and a circuit breaker; the SDK's own retries are off
+client = RateLimitedClient(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0))
 
 # Constants
 HISTORY_FILE = "history.txt"
 MAX_HISTORY_LINES = 10
 IMAGE_FOLDER = "Generated_Images"
 BATCH_SIZE = 3  # Trigger image generation every 3 inputs
+MAX_IN_FLIGHT = 1  # Image API calls allowed at the same time
+MAX_BACKLOG = 2  # Batches waiting for a free slot before BACKLOG_POLICY applies
+BACKLOG_POLICY = "coalesce"  # "coalesce", "drop_oldest" or "drop_newest"
+SPECULATIVE = os.getenv("SPECULATIVE") == "1"  # Start generating on the first input instead of a full batch
+MAX_BATCH_WAIT = 4.0  # Speculative mode: seconds an input waits for companions while a call is running
+TARGET_LATENCY = 20.0  # Speculative mode: seconds from speaking to image to aim for
 DURATION = 5  # Duration of audio capture in seconds
 FS = 16000  # Sample rate for Whisper (16kHz is recommended)
+STT_ENGINE = os.getenv("STT_ENGINE", "openai")  # "openai", "local" or "google"
+CANVAS_MODE = os.getenv("CANVAS_MODE") == "1"  # Repaint tiles of one 16:9 master instead of whole images
+CANVAS_FILE = os.path.join(IMAGE_FOLDER, "canvas.jpeg")
+STATIONS_PORT = int(os.getenv("STATIONS_PORT", "0"))  # Accept inputs from stationagent.py on this port
+STATIONS_HOST = os.getenv("STATIONS_HOST", "127.0.0.1")  # 0.0.0.0 for agents on other machines
+LOCAL_MIC = os.getenv("LOCAL_MIC", "1") == "1"  # Also listen on this machine's microphone
+INPUT_JOURNAL = "input_queue.sqlite3"  # Transcriptions not yet turned into an image, replayed on restart
+JOURNAL_FLUSH_TIMEOUT = 5.0  # Seconds a station's post waits for its input to reach disk
 
 # Ensure the image folder exists
 if not os.path.exists(IMAGE_FOLDER):
     os.makedirs(IMAGE_FOLDER)
 
-# Queue for transcription and image generation batches
-input_queue = Queue()
-generation_in_progress = threading.Event()  # Track if generation is in progress
+# Persistent counter for image_N.jpeg filenames
+image_sequence = ImageSequence(IMAGE_FOLDER)
+
+# Previously generated images keyed by prompt, for replays and repeated inputs
+generation_cache = GenerationCache()
+
+# Content-addressed copy of every image with the prompt and inputs behind it
+image_store = ImageStore()
+
+# Recent inputs in memory, journaled to HISTORY_FILE
+history_store = HistoryStore(HISTORY_FILE, MAX_HISTORY_LINES)
+
+# Keeps role + batch + newest history under the image model's prompt limit
+prompt_builder = PromptBuilder()
+# Canvas tiles are repainted with DALL-E 2 edits, which take at most 1000 characters
+canvas_prompt_builder = PromptBuilder(max_tokens=DALLE2_PROMPT_TOKENS, max_chars=DALLE2_PROMPT_CHARS)
+
+# History -> prompt -> cache or image API -> numbered file -> image store, shared with benchmark.py
+pipeline = ImagePipeline(client, IMAGE_FOLDER, history_store, generation_cache, image_store, prompt_builder,
+                         image_sequence)
+
+# Every transcription is journaled before it is queued and acked after its generation
+input_journal = DurableQueue(INPUT_JOURNAL)
+
+# Transcriptions waiting to be batched, one queue per station, taken round-robin;
+# items are (journal id, text) so they can be acked once their image is done
+input_queue = StationQueues(on_drop=lambda item: input_journal.ack([item[0]]))
+
+# Repeats and transcribed silence are dropped before they reach the queue or the history
+input_filter = InputFilter()
 
 # Function to detect and transcribe speech with Whisper
 def capture_audio_input():
+    # The stream keeps recording into its ring buffer while we write and transcribe,
+    # so consecutive windows are back to back with no dead time in between
+    microphone = get_microphone(FS)
+    engine = create_engine(STT_ENGINE, client=client) if STT_ENGINE == "openai" else create_engine(STT_ENGINE)
+    print("Listening for input...")
+    windows = microphone.windows(DURATION)
     while True:
-        print("Listening for input...")
-        # Record audio for the specified duration
-        audio_data = sd.rec(int(DURATION * FS), samplerate=FS, channels=1, dtype='int16')
-        sd.wait()  # Wait until recording is finished
-        
+        with metrics.span("capture"):
+            audio_data = next(windows)
+
         # Check if the audio data is non-empty
         if audio_data is None or len(audio_data) == 0:
             print("No audio data captured.")
             continue
-        
-        # Save the audio data to a temporary WAV file
-        audio_file_path = "temp_audio.wav"
-        print(f"Saving audio data to {audio_file_path}...")
-        write(audio_file_path, FS, audio_data)
-        
-        # Confirm that the file was written and has a size
-        if not os.path.exists(audio_file_path) or os.path.getsize(audio_file_path) == 0:
-            print("Error: temp_audio.wav file was not written correctly.")
-            continue
+
         try:
-            # Transcribe audio using OpenAI's Whisper API
-            with open(audio_file_path, "rb") as audio_file:
-                transcription_result = client.audio.transcribe("whisper-1", audio_file)
-                transcription = transcription_result.text
-                print(f"Recognized input: {transcription}")
-                input_queue.put(transcription)  # Add transcription to queue
+            # Transcribe audio with the configured speech engine, straight from memory
+            with metrics.span("transcription"):
+                transcript = engine.transcribe_detailed(audio_data, FS)
+            transcription = input_filter.accept(transcript)
+            if transcription is None:
+                continue
+            print(f"Recognized input: {transcription}")
+            enqueue_input(transcription)  # Add transcription to queue
         except Exception as e:
             print(f"Error with transcription: {e}")
 
-# Function to update and retrieve history
-def update_and_get_history(new_inputs):
-    history = deque(maxlen=MAX_HISTORY_LINES)
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as file:
-            for line in file:
-                history.append(line.strip())
-
-    history.extend(new_inputs)
-    with open(HISTORY_FILE, "a") as file:
-        for input in new_inputs:
-            file.write(f"{input}\n")
-
-    return list(history)
-
-# Get the next available filename for saving images
-def get_next_image_filename():
-    existing_files = os.listdir(IMAGE_FOLDER)
-    image_numbers = [
-        int(f.split("_")[1].split(".")[0]) for f in existing_files if f.startswith("image_") and f.endswith(".jpeg")
-    ]
-    next_number = max(image_numbers) + 1 if image_numbers else 1
-    return f"image_{next_number}.jpeg"
-
-# Function to generate an image based on user inputs
-def generate_image(system_role, user_inputs):
-    history_inputs = update_and_get_history(user_inputs)
-    combined_history = ". ".join(history_inputs)
-    combined_inputs = ". ".join(user_inputs)
-
-    final_prompt = (
-        f"{system_role}\n\n"
-        f"Here is the collaborative context from multiple users: {combined_inputs}. "
-        f"Additionally, here is the recent history of inputs: {combined_history}. "
-    )
-
+# Function to journal a transcription, then queue it for batching; with wait=True, returns
+# whether it reached disk, so a remote station only drops its copy once it is safe
+def enqueue_input(transcription, station=LOCAL_STATION, wait=False):
+    input_queue.put((input_journal.put(transcription, station), transcription), station)
+    return input_journal.flush(JOURNAL_FLUSH_TIMEOUT) if wait else True
+
+# Function to put transcriptions left over from the last run back in the queue; `pending` is
+# read before any producer starts, so nothing journaled by this run is queued twice
+def replay_journal(pending):
+    if pending:
+        print(f"Replaying {len(pending)} transcriptions from the last run")
+    for entry_id, station, transcription in pending:
+        # Waits for room instead of pushing older entries out of a full station queue
+        input_queue.put((entry_id, transcription), station, block=True)
+
+# Function to wrap a generate function so its inputs are acked once their image is published
+def acking(generate):
+    def run(system_role, items, claim=None):
+        discarded = []
+
+        def tracked_claim():
+            allowed = claim()
+            if not allowed:
+                discarded.append(True)
+            return allowed
+
+        result = generate(system_role, [transcription for _, transcription in items], tracked_claim if claim else None)
+        if result or discarded:
+            input_journal.ack([entry_id for entry_id, _ in items])
+        else:
+            # Failed call: the entries stay in the journal and are replayed on the next start
+            print(f"Keeping {len(items)} inputs in the journal after a failed generation")
+        return result
+    return run
+
+# Function to ack inputs the scheduler dropped, so they are not replayed either
+def ack_dropped(items):
+    input_journal.ack([entry_id for entry_id, _ in items])
+
+# Function to repaint only this batch's tiles of the projection canvas
+def generate_canvas_image(system_role, user_inputs, canvas, render_tile):
+    final_prompt = pipeline.build_prompt(system_role, user_inputs, canvas_prompt_builder)
     try:
-        response = client.images.generate(model="dall-e-3", prompt=final_prompt,
-        n=1,
-        size="1024x1024")
-
-        # Extract the image URL from the response
-        image_url = response.data[0].url
-        print(f"Image URL: {image_url}")
-
-        img_data = requests.get(image_url).content
-        img_filename = get_next_image_filename()
-        img_filepath = os.path.join(IMAGE_FOLDER, img_filename)
-
-        with open(img_filepath, 'wb') as handler:
-            handler.write(img_data)
-
-        print(f"Image saved as {img_filepath}")
+        with metrics.span("api_call"):
+            img_filepath = canvas.update(final_prompt, render_tile)
+        print(f"Canvas saved as {img_filepath}")
+        # canvas.jpeg is overwritten every batch; the store keeps each state, chained by parent
+        previous = image_store.latest("canvas")
+        image_store.add_file(img_filepath, prompt=final_prompt, inputs=user_inputs, mode="canvas",
+                             parent=previous.digest if previous else None)
         return img_filepath
-
     except Exception as e:
-        print(f"Error generating image: {e}")
+        print(f"Error generating canvas tiles: {e}")
         return None
 
-# Worker function to monitor input queue and trigger generation
-def process_inputs():
-    system_role = (
-        "You are an AI model specializing in collaborative art generation. "
-        "Your role is to combine multiple user inputs in a hand-drawn sketch illustration on a black background, "
-        "with a focus on outlines and a childlike, minimalistic but colorful style. "
-        "Always use a black background to ensure consistency. "
-        "Use a 16:9 aspect ratio to ensure consistency."
-    )
-
+# Worker function to monitor input queue and hand full batches to the scheduler
+def process_inputs(scheduler):
     batch = []
     while True:
-        transcription = input_queue.get()  # Get transcription from the queue
-        batch.append(transcription)
+        item = input_queue.get()  # Get (journal id, transcription) from the queue
+        if SPECULATIVE:
+            # The batcher decides when to launch, from one input up to a full batch
+            scheduler.add(item)
+            continue
+        batch.append(item)
 
         if len(batch) == BATCH_SIZE:
-            # If generation is in progress, wait for it to complete
-            if generation_in_progress.is_set():
-                print("Generation in progress, waiting to queue next batch.")
-                generation_in_progress.wait()  # Wait until the current generation finishes
-
-            # Start image generation with the collected batch
-            generation_in_progress.set()  # Mark generation as in progress
-            threading.Thread(target=generate_and_clear_batch, args=(system_role, batch)).start()
+            # The scheduler bounds concurrent calls and merges batches that pile up
+            print("Queueing image generation with batch:", [transcription for _, transcription in batch])
+            scheduler.submit(batch)
             batch = []  # Reset batch
 
-# Generate image and clear batch
-def generate_and_clear_batch(system_role, batch):
-    print("Generating image with batch:", batch)
-    generate_image(system_role, batch)
-    generation_in_progress.clear()  # Mark generation as complete
-
 # Start the audio capture and processing threads
 if __name__ == "__main__":
+    system_role = (
+        "You are an AI model specializing in collaborative art generation. "
+        "Your role is to combine multiple user inputs in a hand-drawn sketch illustration on a black background, "
+        "with a focus on outlines and a childlike, minimalistic but colorful style. "
+        "Always use a black background to ensure consistency. "
+        "Use a 16:9 aspect ratio to ensure consistency."
+    )
+    generate = pipeline.generate
+    if CANVAS_MODE:
+        canvas = TiledCanvas(CANVAS_FILE)
+        render_tile = edit_tile_renderer(client)
+        # Tiles blend into one shared canvas, so every speculative result is kept
+        generate = lambda role, inputs, claim=None: generate_canvas_image(role, inputs, canvas, render_tile)
+    if SPECULATIVE:
+        scheduler = SpeculativeBatcher(acking(generate), system_role, BATCH_SIZE, MAX_BATCH_WAIT, TARGET_LATENCY)
+    else:
+        scheduler = GenerationScheduler(acking(generate), system_role, MAX_IN_FLIGHT, MAX_BACKLOG, BACKLOG_POLICY,
+                                        on_drop=ack_dropped)
+    threading.Thread(target=replay_journal, args=(input_journal.pending(),), daemon=True).start()
+
+    # Prometheus text on METRICS_PORT, plus a rotating JSONL of spans if METRICS_JSONL is set
+    metrics.gauge("input_queue_depth", input_queue.qsize)
+    metrics.gauge("input_journal_pending", lambda: len(input_journal))
+    metrics.gauge("generation_queue_depth", lambda: scheduler.stats()["queue_depth"])
+    metrics.gauge("generation_in_flight", lambda: scheduler.stats()["in_flight"])
+    metrics.serve(METRICS_PORT)
+    if METRICS_JSONL:
+        metrics.export_jsonl(METRICS_JSONL)
+
     # Start listening thread
-    threading.Thread(target=capture_audio_input, daemon=True).start()
+    if LOCAL_MIC:
+        threading.Thread(target=capture_audio_input, daemon=True).start()
+
+    # Station agents post here; history, numbering and the image store stay in this one process
+    if STATIONS_PORT:
+        StationIntake(input_queue, input_filter.accept, STATIONS_HOST, STATIONS_PORT,
+                      lambda text, station: enqueue_input(text, station, wait=True)).start()
 
     # Start processing thread
-    threading.Thread(target=process_inputs, daemon=True).start()
+    threading.Thread(target=process_inputs, args=(scheduler,), daemon=True).start()
 
-    # Keep the main thread alive
+    # Keep the main thread alive and report the generation queue now and then
     while True:
-        time.sleep(1)
\ No newline at end of file
+        time.sleep(60)
+        stats = scheduler.stats()
+        print(f"Generation queue: depth {stats['queue_depth']}, in flight {stats['in_flight']}, "
+              f"avg wait {stats['avg_wait']:.1f}s, max wait {stats['max_wait']:.1f}s, "
+              f"coalesced {stats['coalesced']}, dropped {stats['dropped']}")
\ No newline at end of file
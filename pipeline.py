@@ -0,0 +1,80 @@
+import os
+from imagefetch import save_image, write_atomic, RESPONSE_FORMAT
+from imagesequence import ImageSequence
+from promptbuilder import PromptBuilder
+from metrics import metrics
+
+##################################
+#########   Batch -> prompt -> image generation path
+##################################
+
+MODEL = "dall-e-3"
+SIZE = "1024x1024"
+
+
+class ImagePipeline:
+    """The generate path of permanentlisten.py: history, prompt, cache, image API, save, image store.
+
+    Everything it writes to is passed in (client, image folder, history, cache,
+    store), so benchmark.py runs this same code against the fake server in a
+    temp folder instead of a hand-copied version of it.
+    """
+
+    def __init__(self, client, image_folder, history_store, generation_cache, image_store, prompt_builder=None,
+                 image_sequence=None, model=MODEL, size=SIZE):
+        self.client = client
+        self.image_folder = image_folder
+        self.history_store = history_store
+        self.generation_cache = generation_cache
+        self.image_store = image_store
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.image_sequence = image_sequence or ImageSequence(image_folder)
+        self.model = model
+        self.size = size
+
+    def next_filepath(self):
+        return os.path.join(self.image_folder, self.image_sequence.next_filename())
+
+    def build_prompt(self, system_role, user_inputs, builder=None):
+        """Record the batch in the history and combine role, batch and recent history into one prompt."""
+        with metrics.span("history_update"):
+            # Recent window comes from memory; new inputs are journaled to the history file in batches
+            history_inputs = self.history_store.add(user_inputs)
+        with metrics.span("prompt_build"):
+            return (builder or self.prompt_builder).build(system_role, user_inputs, history_inputs)
+
+    def generate(self, system_role, user_inputs, claim=None):
+        """Generate and save one image for the batch; with `claim`, publish only if claim() allows it."""
+        final_prompt = self.build_prompt(system_role, user_inputs)
+
+        cache_key = self.generation_cache.key(final_prompt, self.model, self.size)
+        # Image numbers are taken only when publishing, so they follow display order
+        cached = self.generation_cache.get(cache_key)
+        if cached is not None:
+            if claim and not claim():
+                return None  # A newer batch is already on screen
+            img_filepath = self.next_filepath()
+            write_atomic(img_filepath, [cached])
+            print(f"Cache hit, image saved as {img_filepath}")
+            self.image_store.add_file(img_filepath, prompt=final_prompt, inputs=user_inputs, mode="cached",
+                                      model=self.model)
+            return img_filepath
+
+        try:
+            with metrics.span("api_call"):
+                response = self.client.images.generate(model=self.model, prompt=final_prompt, n=1, size=self.size,
+                                                       response_format=RESPONSE_FORMAT)
+
+            if claim and not claim():
+                print(f"Discarding image for {user_inputs}: a newer batch was already shown")
+                return None
+            img_filepath = self.next_filepath()
+            save_image(response.data[0], img_filepath)
+            self.generation_cache.put(cache_key, img_filepath)
+            self.image_store.add_file(img_filepath, prompt=final_prompt, inputs=user_inputs, mode="generate",
+                                      model=self.model)
+            return img_filepath
+
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            return None
@@ -0,0 +1,103 @@
+import threading
+from collections import Counter, OrderedDict
+import tiktoken
+
+##################################
+#########   Token-budgeted prompt assembly
+##################################
+
+ENCODING = "cl100k_base"
+MAX_PROMPT_TOKENS = 850  # DALL-E 3 takes 4000 characters; English runs ~4 characters per token
+MAX_PROMPT_CHARS = 4000
+DALLE2_PROMPT_TOKENS = 220  # DALL-E 2 (edits, variations, canvas tiles) takes 1000 characters
+DALLE2_PROMPT_CHARS = 1000
+INPUTS_LABEL = "Here is the collaborative context from multiple users:"
+HISTORY_LABEL = "Additionally, here is the recent history of inputs:"
+SEPARATOR = ". "
+CACHE_ENTRIES = 4096
+
+
+class PromptBuilder:
+    """Builds role + current inputs + recent history within a token budget.
+
+    Parts are added by priority: the system role, then the current inputs in
+    order, then history from the newest entry backwards, so when the budget runs
+    out it is the oldest history that is left out (whole entries only), and at
+    worst the tail of the last current input that fits is cut. History entries that are the current
+    inputs are skipped, since HistoryStore.add returns the batch as part of the
+    window. Token counts are cached per string, so a build only encodes the new
+    inputs and whatever role/history text it has not seen before.
+    """
+
+    def __init__(self, max_tokens=MAX_PROMPT_TOKENS, max_chars=MAX_PROMPT_CHARS, encoding=ENCODING,
+                 cache_entries=CACHE_ENTRIES):
+        self.max_tokens = max_tokens
+        self.max_chars = max_chars
+        self.encoding = tiktoken.get_encoding(encoding)
+        self.cache_entries = cache_entries
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+        self.separator_tokens = self.count(SEPARATOR)
+
+    def count(self, text):
+        with self.lock:
+            if text in self.counts:
+                self.counts.move_to_end(text)
+                return self.counts[text]
+        tokens = len(self.encoding.encode(text))
+        with self.lock:
+            self.counts[text] = tokens
+            while len(self.counts) > self.cache_entries:
+                self.counts.popitem(last=False)
+        return tokens
+
+    def truncate(self, text, tokens):
+        return self.encoding.decode(self.encoding.encode(text)[:max(0, tokens)]).rstrip()
+
+    def _fit(self, entries, budget, truncate_last=True):
+        # Take entries in priority order while they fit; the first one that does not is truncated or dropped
+        kept = []
+        for entry in entries:
+            cost = self.count(entry) + (self.separator_tokens if kept else 0)
+            if cost <= budget:
+                kept.append(entry)
+                budget -= cost
+                continue
+            if truncate_last and (not kept or budget > self.separator_tokens):
+                partial = self.truncate(entry, budget - (self.separator_tokens if kept else 0))
+                if partial:
+                    kept.append(partial)
+            break
+        return kept
+
+    def build(self, system_role, inputs, history=(), inputs_label=INPUTS_LABEL, history_label=HISTORY_LABEL,
+              closing=""):
+        """Assemble the prompt; `history` is the recent window, newest last."""
+        inputs = [" ".join(text.split()) for text in inputs if text.strip()]
+        # Drop one history occurrence per current input, newest first
+        skip = Counter(inputs)
+        earlier = []
+        for entry in reversed(history):
+            entry = " ".join(entry.split())
+            if not entry:
+                continue
+            if skip[entry] > 0:
+                skip[entry] -= 1
+            else:
+                earlier.append(entry)
+
+        fixed = "\n\n" + inputs_label + " " + ". " + closing
+        budget = self.max_tokens - self.count(fixed)
+        role = system_role if self.count(system_role) <= budget else self.truncate(system_role, budget)
+        budget -= self.count(role)
+        inputs = self._fit(inputs, budget)
+        budget -= sum(self.count(text) for text in inputs) + self.separator_tokens * max(0, len(inputs) - 1)
+        history_cost = self.count(" " + history_label + " " + ". ")
+        earlier = self._fit(earlier, budget - history_cost, truncate_last=False) if budget > history_cost else []
+
+        prompt = f"{role}\n\n{inputs_label} {SEPARATOR.join(inputs)}. "
+        if earlier:
+            prompt += f"{history_label} {SEPARATOR.join(reversed(earlier))}. "
+        if closing:
+            prompt += closing
+        return prompt[:self.max_chars]
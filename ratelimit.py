@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+import openai
+from metrics import metrics
+
+##################################
+#########   Rate limiting, retries and circuit breaking for OpenAI calls
+##################################
+
+# Requests per second and burst size per endpoint group, roughly the tier-1 limits
+RATE_LIMITS = {
+    "images": (5 / 60, 2),
+    "audio": (50 / 60, 5),
+}
+MAX_RETRIES = 4
+BASE_DELAY = 1.0  # Seconds, doubled on every retry
+MAX_DELAY = 60.0
+FAILURE_THRESHOLD = 5  # Consecutive failures that open the circuit
+RESET_TIMEOUT = 30.0  # Seconds the circuit stays open before a trial call
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Blocking token bucket whose rate adapts: halved on 429s, regrown on successes."""
+
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, pause=0.0):
+        # The provider said slow down: halve the rate and optionally drain the bucket
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            if pause:
+                self._refill(time.monotonic())
+                self.tokens = min(self.tokens, 1 - pause * self.rate)
+
+    def relax(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive failures, retries after `reset_timeout`."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self, name):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{name} circuit open after {self.failures} consecutive failures")
+            # Half-open: let this call through as a trial
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# Function to read the server's Retry-After hint (seconds) from an API error, if any
+def retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+# Function to tell transient errors (worth retrying) from ones that will fail again
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class _Endpoint:
+    def __init__(self, owner, group, target):
+        self._owner = owner
+        self._group = group
+        self._target = target
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if callable(attribute):
+            return lambda *args, **kwargs: self._owner.call(self._group, attribute, *args, **kwargs)
+        return _Endpoint(self._owner, self._group, attribute)
+
+
+class RateLimitedClient:
+    """Drop-in wrapper: `client.images.generate(...)` etc. go through one limiter per endpoint group.
+
+    Every call waits for a token, retries transient errors with jittered
+    exponential backoff (at least as long as Retry-After), and the group's circuit
+    breaker fails calls fast while the provider keeps erroring.
+    Wrap a client created with max_retries=0 so the SDK does not retry as well.
+    """
+
+    def __init__(self, client, rate_limits=RATE_LIMITS, max_retries=MAX_RETRIES):
+        self.client = client
+        self.max_retries = max_retries
+        self.buckets = {group: TokenBucket(rate, burst) for group, (rate, burst) in rate_limits.items()}
+        self.breakers = {group: CircuitBreaker() for group in rate_limits}
+
+    def __getattr__(self, name):
+        target = getattr(self.client, name)
+        return _Endpoint(self, name, target) if name in self.buckets else target
+
+    def call(self, group, function, *args, **kwargs):
+        bucket = self.buckets[group]
+        breaker = self.breakers[group]
+        for attempt in range(self.max_retries + 1):
+            breaker.check(group)
+            bucket.acquire()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                breaker.record_failure()
+                hint = retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    bucket.throttle(hint or 0.0)
+                metrics.inc("api_retries_total", group=group, error=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise
+                delay = min(MAX_DELAY, BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+                delay = max(delay, hint or 0.0)
+                print(f"{group} call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                breaker.record_success()
+                bucket.relax()
+                return result
@@ -0,0 +1,260 @@
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+##################################
+#########   Bounded image-generation scheduler
+##################################
+
+MAX_IN_FLIGHT = 1  # Concurrent image API calls
+MAX_BACKLOG = 2  # Batches allowed to wait for a free slot
+POLICIES = ("coalesce", "drop_oldest", "drop_newest")
+MAX_BATCH_WAIT = 4.0  # Seconds an input waits for companions before it is generated anyway
+TARGET_LATENCY = 20.0  # Seconds from speaking to image the speculative batcher aims for
+SPECULATIVE_IN_FLIGHT = 2  # A partial batch plus the full batch that supersedes it
+
+
+class GenerationScheduler:
+    """Runs `generate(system_role, inputs)` on at most `max_in_flight` worker threads.
+
+    Batches that arrive while every worker is busy wait in a backlog of at most
+    `max_backlog` entries. When that is full the policy decides what happens:
+    "coalesce" merges the new inputs into the newest waiting batch (one prompt
+    instead of several calls), "drop_oldest" discards the oldest waiting batch and
+    "drop_newest" discards the incoming one. Dropped inputs are passed to
+    `on_drop`, if given.
+    """
+
+    def __init__(self, generate, system_role, max_in_flight=MAX_IN_FLIGHT, max_backlog=MAX_BACKLOG, policy="coalesce",
+                 on_drop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backlog policy '{policy}', choose from {POLICIES}")
+        self.generate = generate
+        self.system_role = system_role
+        self.max_backlog = max_backlog
+        self.policy = policy
+        self.on_drop = on_drop or (lambda inputs: None)
+        self.backlog = deque()  # [inputs, enqueued_at]
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "coalesced": 0}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.running = True
+        self.workers = [
+            threading.Thread(target=self._work, name=f"generation-{i}", daemon=True)
+            for i in range(max_in_flight)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, inputs):
+        """Queue a batch of inputs; returns False if the policy dropped it."""
+        with self.cond:
+            self.counts["submitted"] += 1
+            if len(self.backlog) < self.max_backlog:
+                self.backlog.append([list(inputs), time.monotonic()])
+            elif self.policy == "coalesce" and self.backlog:
+                self.backlog[-1][0].extend(inputs)
+                self.counts["coalesced"] += 1
+            elif self.policy == "drop_oldest" and self.backlog:
+                self.on_drop(self.backlog.popleft()[0])
+                self.backlog.append([list(inputs), time.monotonic()])
+                self.counts["dropped"] += 1
+            else:
+                self.counts["dropped"] += 1
+                self.on_drop(list(inputs))
+                return False
+            self.cond.notify()
+            return True
+
+    def _work(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.backlog or not self.running)
+                if not self.running and not self.backlog:
+                    return
+                inputs, enqueued_at = self.backlog.popleft()
+                waited = time.monotonic() - enqueued_at
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                self.in_flight += 1
+            try:
+                result = self.generate(self.system_role, inputs)
+            except Exception as e:
+                print(f"Error generating image: {e}")
+                result = None
+            with self.cond:
+                self.in_flight -= 1
+                self.counts["completed" if result else "failed"] += 1
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            started = self.counts["completed"] + self.counts["failed"] + self.in_flight
+            return {
+                "queue_depth": len(self.backlog),
+                "in_flight": self.in_flight,
+                "avg_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait,
+                **self.counts,
+            }
+
+    def close(self, wait=True):
+        # Stop accepting work; workers finish the backlog before exiting
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+
+class _Job:
+    def __init__(self, seq, inputs, first_at):
+        self.seq = seq
+        self.inputs = inputs
+        self.first_at = first_at
+        self.future = None
+        self.superseded = False
+
+
+class SpeculativeBatcher:
+    """Starts generating on partial batches instead of waiting for `batch_size` inputs.
+
+    When nothing is generating, the first input launches a call at once, so a lone
+    visitor waits one API round-trip rather than for two strangers to speak. Inputs
+    that arrive meanwhile are held for at most the batch wait (`max_wait`, shortened
+    so that wait plus the typical generation time stays within `target_latency`)
+    and launch early when the batch fills. A new launch folds in any batch still
+    waiting for a worker (cancelled, "coalesced"), and a call that finishes after a
+    newer batch has already published is discarded ("dropped") via the `claim`
+    callback: `generate(system_role, inputs, claim)` must call `claim()` right
+    before publishing and skip publishing when it returns False.
+    """
+
+    def __init__(self, generate, system_role, batch_size, max_wait=MAX_BATCH_WAIT, target_latency=TARGET_LATENCY,
+                 max_in_flight=SPECULATIVE_IN_FLIGHT):
+        self.generate = generate
+        self.system_role = system_role
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.target_latency = target_latency
+        self.pending = []
+        self.first_at = None
+        self.jobs = {}  # seq -> launched _Job that has not finished
+        self.next_seq = 0
+        self.published_seq = -1
+        self.in_flight = 0
+        self.generation_times = deque(maxlen=20)
+        self.counts = {"submitted": 0, "launched": 0, "completed": 0, "failed": 0, "dropped": 0, "coalesced": 0}
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.cond = threading.Condition()
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="speculative")
+        threading.Thread(target=self._timer, name="speculative-timer", daemon=True).start()
+
+    def batch_wait(self):
+        # Leave room for a typical generation inside the latency target
+        if not self.generation_times or not self.target_latency:
+            return self.max_wait
+        return max(0.0, min(self.max_wait, self.target_latency - statistics.median(self.generation_times)))
+
+    def add(self, item):
+        """Hand over one input; it is generated alone, with companions, or folded into a later batch."""
+        with self.cond:
+            self.counts["submitted"] += 1
+            if not self.pending:
+                self.first_at = time.monotonic()
+            self.pending.append(item)
+            self._maybe_launch()
+            self.cond.notify_all()
+
+    def _maybe_launch(self):
+        if not self.pending or not self.running:
+            return
+        full = len(self.pending) >= self.batch_size
+        overdue = time.monotonic() - self.first_at >= self.batch_wait()
+        if full or overdue or not self.jobs:
+            self._launch()
+
+    def _launch(self):
+        inputs, first_at = self.pending, self.first_at
+        self.pending, self.first_at = [], None
+        # Batches still waiting for a worker join this one instead of costing a call each
+        for seq, job in sorted(self.jobs.items()):
+            if job.future.cancel():
+                inputs = job.inputs + inputs
+                first_at = min(first_at, job.first_at)
+                del self.jobs[seq]
+                self.counts["coalesced"] += 1
+        job = _Job(self.next_seq, inputs, first_at)
+        self.next_seq += 1
+        self.jobs[job.seq] = job
+        self.counts["launched"] += 1
+        job.future = self.executor.submit(self._run, job)
+
+    def _claim(self, job):
+        with self.cond:
+            if job.seq < self.published_seq:
+                job.superseded = True
+                return False
+            self.published_seq = job.seq
+            return True
+
+    def _run(self, job):
+        started = time.monotonic()
+        with self.cond:
+            self.in_flight += 1
+            waited = started - job.first_at
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+        try:
+            result = self.generate(self.system_role, job.inputs, lambda: self._claim(job))
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            result = None
+        with self.cond:
+            self.in_flight -= 1
+            del self.jobs[job.seq]
+            if job.superseded:
+                self.counts["dropped"] += 1
+            else:
+                self.counts["completed" if result else "failed"] += 1
+            if result:
+                self.generation_times.append(time.monotonic() - started)
+            self._maybe_launch()  # Inputs held back while this call ran
+            self.cond.notify_all()
+
+    def _timer(self):
+        with self.cond:
+            while self.running:
+                if self.pending:
+                    self.cond.wait(max(0.0, self.first_at + self.batch_wait() - time.monotonic()))
+                    self._maybe_launch()
+                else:
+                    self.cond.wait()
+
+    def stats(self):
+        with self.cond:
+            started = self.counts["completed"] + self.counts["failed"] + self.counts["dropped"] + self.in_flight
+            return {
+                "queue_depth": len(self.pending) + len(self.jobs) - self.in_flight,
+                "in_flight": self.in_flight,
+                "avg_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait_seen,
+                "batch_wait": self.batch_wait(),
+                **self.counts,
+            }
+
+    def close(self, wait=True):
+        # Launch whatever is still pending, then stop
+        with self.cond:
+            if self.pending:
+                self._launch()
+            self.running = False
+            self.cond.notify_all()
+        self.executor.shutdown(wait=wait)
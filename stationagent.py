@@ -0,0 +1,75 @@
+import os
+import socket
+import threading
+import time
+from queue import Queue, Full
+from dotenv import load_dotenv
+from openai import OpenAI
+from ratelimit import RateLimitedClient
+from audiocapture import get_microphone
+from transcription import create_engine
+from inputfilter import InputFilter
+from stations import post_input, STATIONS_PORT
+from metrics import metrics
+
+##################################
+#########   Station agent: listen, transcribe, post to the generation service
+##################################
+
+# Run one per microphone; the service is permanentlisten.py with STATIONS_PORT set
+load_dotenv()
+
+STATION_NAME = os.getenv("STATION_NAME", socket.gethostname())
+SERVICE_URL = os.getenv("SERVICE_URL", f"http://127.0.0.1:{STATIONS_PORT}")
+STT_ENGINE = os.getenv("STT_ENGINE", "openai")  # "openai", "local" or "google"
+DURATION = 5  # Seconds per transcribed window
+FS = 16000
+OUTBOX_SIZE = 100  # Transcriptions held while the service is unreachable
+RETRY_DELAY = 2.0  # Seconds, doubled per failed attempt up to MAX_RETRY_DELAY
+MAX_RETRY_DELAY = 30.0
+
+outbox = Queue(maxsize=OUTBOX_SIZE)
+
+
+# Function to transcribe windows from the microphone and queue what is worth sending
+def capture_and_transcribe():
+    microphone = get_microphone(FS)
+    engine = create_engine(STT_ENGINE, client=RateLimitedClient(OpenAI(max_retries=0))) \
+        if STT_ENGINE == "openai" else create_engine(STT_ENGINE)
+    input_filter = InputFilter()
+    print(f"Station {STATION_NAME} listening, posting to {SERVICE_URL}")
+    for audio_data in microphone.windows(DURATION):
+        try:
+            with metrics.span("transcription"):
+                transcript = engine.transcribe_detailed(audio_data, FS)
+        except Exception as e:
+            print(f"Error with transcription: {e}")
+            continue
+        text = input_filter.accept(transcript)
+        if text is None:
+            continue
+        try:
+            outbox.put_nowait(text)
+        except Full:
+            print(f"Outbox full, dropping: {text}")
+
+
+# Function to post queued transcriptions in order, holding on to each until the service takes it
+def send_outbox():
+    while True:
+        text = outbox.get()
+        delay = RETRY_DELAY
+        while True:
+            try:
+                accepted = post_input(SERVICE_URL, STATION_NAME, text)
+                print(f"Sent: {text}" if accepted else f"Service skipped (repeat): {text}")
+                break
+            except Exception as e:
+                print(f"Service unreachable ({e.__class__.__name__}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(MAX_RETRY_DELAY, delay * 2)
+
+
+if __name__ == "__main__":
+    threading.Thread(target=send_outbox, daemon=True).start()
+    capture_and_transcribe()
@@ -0,0 +1,143 @@
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty
+from imagefetch import session
+
+##################################
+#########   Station inputs for the central generation service
+##################################
+
+STATIONS_PORT = 8770
+LOCAL_STATION = "local"
+MAX_PER_STATION = 20  # Pending inputs kept per station; a flooding station loses its oldest first
+POST_TIMEOUT = (3, 10)  # Seconds to connect, seconds to answer
+
+
+class StationQueues:
+    """Drop-in for the input Queue that keeps one queue per station and serves them round-robin.
+
+    `put(item, station)` appends to that station's queue; `get()` takes the next
+    item from the station whose turn it is, so a batch of N consecutive gets mixes
+    stations fairly and one busy microphone cannot starve the others. Items a
+    full station queue pushes out are passed to `on_drop`, if given; with
+    block=True, `put` waits for room instead (used when replaying a backlog).
+    """
+
+    def __init__(self, max_per_station=MAX_PER_STATION, on_drop=None):
+        self.max_per_station = max_per_station
+        self.on_drop = on_drop or (lambda item: None)
+        self.queues = {}
+        self.ready = deque()  # Stations with pending items, in turn order
+        self.received = {}
+        self.dropped = {}
+        self.cond = threading.Condition()
+
+    def put(self, item, station=LOCAL_STATION, block=False):
+        with self.cond:
+            queue = self.queues.setdefault(station, deque())
+            self.received[station] = self.received.get(station, 0) + 1
+            if block:
+                self.cond.wait_for(lambda: len(queue) < self.max_per_station)
+            if len(queue) >= self.max_per_station:
+                self.on_drop(queue.popleft())
+                self.dropped[station] = self.dropped.get(station, 0) + 1
+            queue.append(item)
+            if station not in self.ready:
+                self.ready.append(station)
+            self.cond.notify_all()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.ready, timeout):
+                raise Empty
+            station = self.ready.popleft()
+            queue = self.queues[station]
+            item = queue.popleft()
+            if queue:
+                self.ready.append(station)  # Back of the line
+            self.cond.notify_all()  # A blocked put may have room now
+            return item
+
+    def qsize(self):
+        with self.cond:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self):
+        with self.cond:
+            return {
+                station: {"pending": len(queue), "received": self.received[station], "dropped": self.dropped.get(station, 0)}
+                for station, queue in self.queues.items()
+            }
+
+
+class StationIntake:
+    """HTTP endpoint for station agents: POST /inputs {"station": ..., "text": ...}, GET /stations.
+
+    Every input passes `accept(text)` (e.g. InputFilter.accept, which also catches
+    the same thing said at two stations) before `enqueue(text, station)` queues it
+    (`queues.put` unless given, e.g. to journal it first). If `enqueue` returns
+    False the input is not known to be stored and the station gets a 503 to retry.
+    """
+
+    def __init__(self, queues, accept=None, host="127.0.0.1", port=STATIONS_PORT, enqueue=None):
+        self.queues = queues
+        self.accept = accept or (lambda text: text)
+        self.enqueue = enqueue or (lambda text, station: queues.put(text, station) or True)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+
+    def _handler(self):
+        intake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path != "/stations":
+                    return self._reply(404, {"error": "not found"})
+                self._reply(200, intake.queues.stats())
+
+            def do_POST(self):
+                if self.path != "/inputs":
+                    return self._reply(404, {"error": "not found"})
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    station, text = str(payload["station"]), str(payload["text"])
+                except (ValueError, KeyError, TypeError) as e:
+                    return self._reply(400, {"error": f"expected JSON with station and text: {e}"})
+                text = intake.accept(text)
+                if text:
+                    print(f"Station {station}: {text}")
+                    if not intake.enqueue(text, station):
+                        return self._reply(503, {"error": "input could not be stored, retry"})
+                self._reply(202, {"accepted": bool(text)})
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        host, port = self.httpd.server_address[:2]
+        print(f"Accepting station inputs on http://{host}:{port}/inputs")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Function for agents to hand one transcription to the service; raises on failure so callers can retry
+def post_input(service_url, station, text, timeout=POST_TIMEOUT):
+    response = session.post(f"{service_url.rstrip('/')}/inputs", json={"station": station, "text": text},
+                            timeout=timeout)
+    response.raise_for_status()
+    return response.json()["accepted"]
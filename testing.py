@@ -1,6 +1,7 @@
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
+from imageprep import prepare_image, prepare_mask
 # Load environment variables
 load_dotenv()
 
@@ -9,8 +10,8 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
 response = client.images.edit(
-    image=open("k.png", "rb"),
-    mask=open("k_mask.png", "rb"),
+    image=prepare_image("k.png", "512x512"),
+    mask=prepare_mask("k_mask.png", "512x512"),
     prompt="fill with elephants",
     n=1,
     size="512x512",
@@ -1,60 +1,76 @@
-import whisper
-import torch
-from silero_vad import get_speech_timestamps, read_audio
-import sounddevice as sd
-import numpy as np
-import tempfile
-import scipy.io.wavfile as wav
+from models import model_manager, WHISPER_MODEL
+import os
+import threading
 import warnings
+from queue import Queue
+from audiocapture import get_microphone
+from vad import StreamingSegmenter
+from transcribepool import TranscriptionPool, TRANSCRIBE_WORKERS
+from transcription import take_batch
+from metrics import metrics
 
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
 
-# Load Whisper model
-model = whisper.load_model("base")  # Choose the model size as per your requirements
-
-# Load Silero VAD model
-vad_model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', source='github', trust_repo=True)
-(get_speech_timestamps, _, _, _, _) = utils
-
 # Sampling rate for recording
 fs = 16000
+# Own port so this can run next to permanentlisten.py, which serves on METRICS_PORT (9108)
+TRANSCRIBE_METRICS_PORT = int(os.getenv("TRANSCRIBE_METRICS_PORT", "9109"))
+MAX_BATCH = 8  # Utterances decoded together in one padded Whisper pass
+BATCH_WAIT = 0.2  # Seconds to wait for more utterances after the first one is ready
 
-# Function to continuously record audio in chunks
-def record_audio_chunk(duration, fs=16000):
-    audio = sd.rec(int(duration * fs), samplerate=fs, channels=1, dtype='int16')
-    sd.wait()  # Wait until the recording is finished
-    return audio.flatten()
+# Function to stream fixed-size VAD frames from the shared ring buffer
+def record_audio_frames(frame_samples, fs=16000):
+    microphone = get_microphone(fs)
+    # Start from now so speech during model warm-up is still segmented once the VAD is ready
+    return microphone.ring.windows(frame_samples, start=microphone.ring.written)
 
 # Main function to capture live audio, detect speech, and transcribe
 def live_transcribe():
-    print("Starting live transcription. Press Ctrl+C to stop.")
+    print(f"Starting live transcription with {TRANSCRIBE_WORKERS} workers. Press Ctrl+C to stop.")
+    # Workers load Whisper from the local cache (WHISPER_MODEL picks the size) while
+    # the VAD warms up here; the microphone starts recording straight away
+    pool = TranscriptionPool("local", model_name=WHISPER_MODEL)
+    pool.warm()
+    metrics.gauge("transcription_queue_depth", pool.pending)
+    metrics.serve(TRANSCRIBE_METRICS_PORT)
+    model_manager.warm("vad")
+    threading.Thread(target=print_transcriptions, args=(pool,), daemon=True).start()
+    frames = record_audio_frames(512, fs=fs)
+    vad_model, _ = model_manager.vad()
+    segmenter = StreamingSegmenter(vad_model, fs=fs)
+    model_manager.report()
+    utterances = Queue()
+    threading.Thread(target=segment_utterances, args=(segmenter, frames, utterances), daemon=True).start()
     try:
         while True:
-            # Record a chunk of audio
-            audio_chunk = record_audio_chunk(duration=5, fs=fs)  # Record for 5 seconds at a time
-            
-            # Convert recorded audio chunk to a format Silero VAD can use
-            audio_data = np.int16(audio_chunk)
-            
-            # Get speech timestamps
-            speech_timestamps = get_speech_timestamps(audio_data, vad_model, sampling_rate=fs)
-            
-            # Process each detected speech segment
-            for idx, ts in enumerate(speech_timestamps):
-                # Extract the speech segment from the recorded chunk
-                start, end = ts['start'], ts['end']
-                speech_segment = audio_data[start:end]
-                
-                # Save speech segment to a temporary file for Whisper
-                with tempfile.NamedTemporaryFile(suffix=".wav") as tmp_file:
-                    wav.write(tmp_file.name, fs, speech_segment)
-                    
-                    # Transcribe using Whisper
-                    result = model.transcribe(tmp_file.name)
-                    print(f"Transcription {idx + 1}: {result['text']}")
-                    
+            # Whatever piled up while the workers were busy goes out as one batch
+            batch = take_batch(utterances, MAX_BATCH, BATCH_WAIT)
+            segments = [utterance for utterance in batch if utterance is not None]
+            if segments:
+                pool.submit(segments, fs)
+            if len(segments) < len(batch):
+                break  # The audio stream ended
+
     except KeyboardInterrupt:
         print("Transcription stopped.")
+    finally:
+        pool.close(wait=False)
+
+# Run the VAD over the frames and queue each utterance as soon as the speaker pauses
+def segment_utterances(segmenter, frames, utterances):
+    # Utterances come out however they line up with chunks; capture and VAD never wait on a worker
+    for utterance in segmenter.segments(frames):
+        utterances.put(utterance)
+    utterances.put(None)
+
+# Print worker results in the order the speech was captured
+def print_transcriptions(pool):
+    count = 0
+    for texts in pool:
+        for text in texts:
+            count += 1
+            print(f"Transcription {count}: {text}")
 
-# Start live transcription
-live_transcribe()
+if __name__ == "__main__":
+    # Start live transcription
+    live_transcribe()
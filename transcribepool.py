@@ -0,0 +1,97 @@
+import os
+import threading
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from queue import Queue
+import numpy as np
+from transcription import create_engine
+
+##################################
+#########   Transcription worker processes
+##################################
+
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+
+# Engine owned by each worker process, loaded once in the initializer
+_engine = None
+
+
+def _init_worker(engine_name, engine_kwargs, threads_per_worker):
+    global _engine
+    warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
+    try:
+        import torch
+        # Split the cores between workers instead of every worker grabbing all of them
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    _engine = create_engine(engine_name, **engine_kwargs)
+    if hasattr(_engine, "load"):
+        _engine.load()
+
+
+def _noop():
+    return None
+
+
+def _transcribe_segments(segments, fs):
+    return _engine.transcribe_batch(segments, fs)
+
+
+class TranscriptionPool:
+    """Pool of worker processes, each holding its own model, fed by a bounded queue.
+
+    `submit` blocks once `max_pending` batches are waiting, so a slow model applies
+    back-pressure instead of growing memory. Results come out of `get` / iteration
+    in the order the segments were submitted.
+    """
+
+    def __init__(self, engine_name="local", workers=TRANSCRIBE_WORKERS, max_pending=None, **engine_kwargs):
+        self.workers = workers
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),  # Torch and fork do not mix
+            initializer=_init_worker,
+            initargs=(engine_name, engine_kwargs, threads_per_worker),
+        )
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 2)
+        self.in_flight = deque()  # Futures in submission order
+        self.completed = Queue()
+        self.lock = threading.Lock()
+
+    def warm(self):
+        # Workers spawn on demand; start them (and their model loads) before the first speech
+        return [self.executor.submit(_noop) for _ in range(self.workers)]
+
+    def submit(self, segments, fs):
+        # Copy now: capture buffers are reused and the executor pickles lazily
+        segments = [np.array(segment) for segment in segments]
+        self.slots.acquire()
+        with self.lock:
+            future = self.executor.submit(_transcribe_segments, segments, fs)
+            self.in_flight.append(future)
+        future.add_done_callback(self._release_in_order)
+        return future
+
+    def _release_in_order(self, future):
+        self.slots.release()
+        with self.lock:
+            while self.in_flight and self.in_flight[0].done():
+                self.completed.put(self.in_flight.popleft())
+
+    def pending(self):
+        return len(self.in_flight)
+
+    def get(self, timeout=None):
+        # Texts of the oldest submitted batch; re-raises worker errors
+        return self.completed.get(timeout=timeout).result()
+
+    def __iter__(self):
+        while True:
+            yield self.get()
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,227 @@
+import io
+import time
+from collections import namedtuple
+from queue import Empty
+import numpy as np
+import speech_recognition as sr
+from scipy.io.wavfile import write
+from scipy.signal import resample_poly
+
+##################################
+#########   In-memory transcription helpers
+##################################
+
+WHISPER_FS = 16000  # Local Whisper expects 16 kHz float32 audio
+
+# text: the whole transcription; segments: (text, no_speech_prob, avg_logprob) per Whisper
+# segment, empty for engines that report no confidences
+Transcript = namedtuple("Transcript", "text segments")
+
+
+# Function to pull (text, no_speech_prob, avg_logprob) out of Whisper segments (dicts or API objects)
+def whisper_segments(segments):
+    fields = ("text", "no_speech_prob", "avg_logprob")
+    return [
+        tuple(segment[f] if isinstance(segment, dict) else getattr(segment, f) for f in fields)
+        for segment in segments or ()
+    ]
+
+
+# Function to convert int16 or float audio to mono float32 in [-1, 1]
+def to_float32(audio):
+    audio = np.asarray(audio).reshape(-1)
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) / 32768.0
+    return audio.astype(np.float32, copy=False)
+
+
+# Function to convert float or int16 audio to mono int16
+def to_int16(audio):
+    audio = np.asarray(audio).reshape(-1)
+    if audio.dtype == np.int16:
+        return audio
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+# Function to resample audio to the rate a backend expects
+def resample(audio, fs, target_fs):
+    if fs == target_fs:
+        return audio
+    divisor = np.gcd(fs, target_fs)
+    return resample_poly(audio, target_fs // divisor, fs // divisor).astype(audio.dtype)
+
+
+# Function to encode a buffer as WAV bytes without touching the disk
+def to_wav_bytes(audio, fs):
+    wav_io = io.BytesIO()
+    write(wav_io, fs, to_int16(audio))
+    return wav_io.getvalue()
+
+
+# Function to transcribe with the OpenAI Whisper API (needs file bytes, so encode in memory)
+def transcribe_openai(client, audio, fs, model="whisper-1", verbose=False):
+    if not verbose:
+        result = client.audio.transcriptions.create(model=model, file=("audio.wav", to_wav_bytes(audio, fs)))
+        return result.text
+    # verbose_json adds per-segment no_speech_prob / avg_logprob (whisper-1 only)
+    result = client.audio.transcriptions.create(model=model, file=("audio.wav", to_wav_bytes(audio, fs)),
+                                                response_format="verbose_json")
+    return Transcript(result.text.strip(), whisper_segments(getattr(result, "segments", None)))
+
+
+# Function to transcribe with Google Speech Recognition straight from the PCM samples
+def transcribe_google(recognizer, audio, fs):
+    audio_data = sr.AudioData(to_int16(audio).tobytes(), fs, 2)
+    return recognizer.recognize_google(audio_data)
+
+
+# Function to transcribe with a loaded local Whisper model, no temporary file needed
+def transcribe_local(model, audio, fs, **options):
+    samples = resample(to_float32(audio), fs, WHISPER_FS)
+    return model.transcribe(samples, **options)["text"]
+
+
+##################################
+#########   Speech-to-text engines
+##################################
+
+
+class SpeechEngine:
+    """Common interface: transcribe one buffer, or a list of buffers at once.
+
+    The `_detailed` variants return Transcripts, with Whisper's per-segment
+    confidences where the backend has them, for filtering out silence.
+    """
+
+    name = None
+
+    def transcribe(self, audio, fs):
+        raise NotImplementedError
+
+    def transcribe_batch(self, segments, fs):
+        # Backends without native batching just loop
+        return [self.transcribe(segment, fs) for segment in segments]
+
+    def transcribe_detailed(self, audio, fs):
+        return Transcript(self.transcribe(audio, fs), [])
+
+    def transcribe_batch_detailed(self, segments, fs):
+        return [self.transcribe_detailed(segment, fs) for segment in segments]
+
+
+class GoogleEngine(SpeechEngine):
+    name = "google"
+
+    def __init__(self, recognizer=None):
+        self.recognizer = recognizer or sr.Recognizer()
+
+    def transcribe(self, audio, fs):
+        try:
+            return transcribe_google(self.recognizer, audio, fs)
+        except sr.UnknownValueError:
+            return ""
+
+
+class OpenAIEngine(SpeechEngine):
+    name = "openai"
+
+    def __init__(self, client=None, model="whisper-1"):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI()
+        self.client = client
+        self.model = model
+
+    def transcribe(self, audio, fs):
+        return transcribe_openai(self.client, audio, fs, model=self.model)
+
+    def transcribe_detailed(self, audio, fs):
+        if self.model != "whisper-1":
+            return super().transcribe_detailed(audio, fs)  # Newer models have no verbose_json
+        return transcribe_openai(self.client, audio, fs, model=self.model, verbose=True)
+
+
+class LocalWhisperEngine(SpeechEngine):
+    """Local Whisper; queued segments are padded to 30 s and decoded in one forward pass."""
+
+    name = "local"
+
+    def __init__(self, model=None, model_name="base", language="en"):
+        self.model = model
+        self.model_name = model_name
+        self.language = language
+
+    def load(self):
+        if self.model is None:
+            from models import ModelManager
+            self.model = ModelManager(whisper_name=self.model_name).whisper()
+        return self.model
+
+    def transcribe(self, audio, fs):
+        return transcribe_local(self.load(), audio, fs, language=self.language).strip()
+
+    def transcribe_detailed(self, audio, fs):
+        samples = resample(to_float32(audio), fs, WHISPER_FS)
+        result = self.load().transcribe(samples, language=self.language)
+        return Transcript(result["text"].strip(), whisper_segments(result["segments"]))
+
+    def transcribe_batch(self, segments, fs):
+        return [transcript.text for transcript in self.transcribe_batch_detailed(segments, fs)]
+
+    def transcribe_batch_detailed(self, segments, fs):
+        import torch
+        import whisper
+
+        model = self.load()
+        samples = [resample(to_float32(segment), fs, WHISPER_FS) for segment in segments]
+        transcripts = [None] * len(samples)
+        batch = []
+        for i, segment in enumerate(samples):
+            if len(segment) <= whisper.audio.N_SAMPLES:
+                batch.append(i)
+            else:
+                # Anything longer than one Whisper window goes through the regular sliding decode
+                result = model.transcribe(segment, language=self.language)
+                transcripts[i] = Transcript(result["text"].strip(), whisper_segments(result["segments"]))
+
+        if batch:
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(samples[i]), model.dims.n_mels)
+                for i in batch
+            ]).to(model.device)
+            options = whisper.DecodingOptions(
+                language=self.language,
+                without_timestamps=True,
+                fp16=model.device.type == "cuda",
+            )
+            for i, result in zip(batch, whisper.decode(model, mel, options)):
+                text = result.text.strip()
+                transcripts[i] = Transcript(text, [(text, result.no_speech_prob, result.avg_logprob)])
+        return transcripts
+
+
+ENGINES = {engine.name: engine for engine in (GoogleEngine, OpenAIEngine, LocalWhisperEngine)}
+
+
+# Function to build a speech engine by name ("google", "openai" or "local")
+def create_engine(name, **kwargs):
+    try:
+        return ENGINES[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown speech engine '{name}', choose from {sorted(ENGINES)}")
+
+
+# Function to pull up to `max_batch` queued segments, waiting at most `timeout` after the first;
+# transcribeonly.py uses it to hand ready utterances to transcribe_batch_detailed together
+def take_batch(segment_queue, max_batch=8, timeout=0.2):
+    batch = [segment_queue.get()]
+    deadline = time.monotonic() + timeout
+    while len(batch) < max_batch:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(segment_queue.get(timeout=remaining))
+        except Empty:
+            break
+    return batch
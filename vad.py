@@ -0,0 +1,120 @@
+import numpy as np
+from collections import deque
+from transcription import to_float32
+from metrics import metrics
+
+##################################
+#########   Streaming voice activity segmentation
+##################################
+
+ENERGY_THRESHOLD = 0.005  # Frame RMS (float scale) below which Silero is not even asked
+
+
+class StreamingSegmenter:
+    """Frame-by-frame utterance segmenter on top of Silero VAD.
+
+    Feed it fixed-size frames (512 samples at 16 kHz) as they arrive. Quiet frames
+    are rejected by an RMS gate without running the network. An utterance starts
+    with `pre_roll` seconds of audio from before the first speech frame, ends after
+    `hangover` seconds of silence and is force-split at `max_utterance` seconds.
+    With `vad_model=None` the energy gate alone decides (used for offline benchmarks).
+    """
+
+    def __init__(self, vad_model, fs=16000, threshold=0.5, energy_threshold=ENERGY_THRESHOLD,
+                 pre_roll=0.3, hangover=0.6, min_speech=0.25, max_utterance=15.0):
+        self.model = vad_model
+        self.fs = fs
+        self.frame_samples = 512 if fs == 16000 else 256  # Sizes Silero v5 accepts
+        self.threshold = threshold
+        self.energy_threshold = energy_threshold
+        self.hangover_frames = max(1, int(hangover * fs / self.frame_samples))
+        self.min_samples = int(min_speech * fs)
+        self.pre_roll = deque(maxlen=max(0, int(pre_roll * fs / self.frame_samples)))
+        self.utterance = np.empty(int(max_utterance * fs), dtype=np.int16)  # Reused for every utterance
+        self.length = 0
+        self.in_speech = False
+        self.silent_frames = 0
+        self.frames_seen = 0
+        self.frames_gated = 0
+        self._pending = np.empty(0, dtype=np.int16)
+
+    def speech_probability(self, frame):
+        self.frames_seen += 1
+        samples = to_float32(frame)
+        if np.sqrt(np.mean(samples * samples)) < self.energy_threshold:
+            self.frames_gated += 1
+            metrics.inc("vad_frames_gated_total")
+            return 0.0
+        if self.model is None:
+            return 1.0
+        import torch
+        with metrics.span("vad"):
+            return self.model(torch.from_numpy(samples), self.fs).item()
+
+    def _append(self, frame):
+        # Returns the samples that did not fit, for the next utterance
+        n = min(len(frame), len(self.utterance) - self.length)
+        self.utterance[self.length:self.length + n] = frame[:n]
+        self.length += n
+        return frame[n:]
+
+    def _emit(self):
+        utterance = self.utterance[:self.length].copy() if self.length >= self.min_samples else None
+        self.length = 0
+        return utterance
+
+    def _end(self):
+        self.in_speech = False
+        self.silent_frames = 0
+        if hasattr(self.model, "reset_states"):
+            self.model.reset_states()
+        return self._emit()
+
+    def process(self, frame):
+        """Consume one frame; returns a finished utterance (int16 array) or None."""
+        frame = np.asarray(frame, dtype=np.int16)
+        is_speech = self.speech_probability(frame) >= self.threshold
+
+        if not self.in_speech:
+            if not is_speech:
+                self.pre_roll.append(frame.copy())
+                return None
+            self.in_speech = True
+            for previous in self.pre_roll:
+                self._append(previous)
+            self.pre_roll.clear()
+
+        overflow = self._append(frame)
+        self.silent_frames = 0 if is_speech else self.silent_frames + 1
+        if self.silent_frames >= self.hangover_frames:
+            return self._end()
+        if self.length >= len(self.utterance):
+            # Too long: emit what we have and keep listening as the same speaker,
+            # starting the next utterance with whatever did not fit
+            utterance = self._emit()
+            self._append(overflow)
+            return utterance
+        return None
+
+    def feed(self, samples):
+        """Consume any number of samples; returns the list of finished utterances."""
+        samples = np.concatenate((self._pending, np.asarray(samples, dtype=np.int16).reshape(-1)))
+        usable = len(samples) - len(samples) % self.frame_samples
+        self._pending = samples[usable:]
+        utterances = []
+        for start in range(0, usable, self.frame_samples):
+            utterance = self.process(samples[start:start + self.frame_samples])
+            if utterance is not None:
+                utterances.append(utterance)
+        return utterances
+
+    def flush(self):
+        # Emit whatever is in progress, e.g. at shutdown or end of a file
+        return self._end() if self.in_speech else None
+
+    def segments(self, frames):
+        """Turn an iterator of frames (e.g. AudioRingBuffer.windows) into utterances."""
+        for frame in frames:
+            utterance = self.process(frame)
+            if utterance is not None:
+                yield utterance